@@ -1,18 +1,78 @@
+import sqlite3
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from .config import Config, engine_options
+from .tenants import TenantSession, tenants
 
 
-db = SQLAlchemy()
-migrate = Migrate()
+def include_object(obj, name, type_, reflected, compare_to):
+    """
+    Таблицы поискового индекса staff_search (FTS5), триграммные индексы staff (PostgreSQL)
+    и помесячные архивы маркеров создаются не миграциями, autogenerate не должен предлагать их удалить
+    """
+    if type_ == 'index' and reflected and compare_to is None and name.endswith('_trgm'):
+        return False
+    return not (type_ == 'table' and reflected and compare_to is None
+                and name.startswith(('staff_search', 'marker_archive_')))
 
 
-def create_app():
+db = SQLAlchemy(session_options={'class_': TenantSession})
+migrate = Migrate(include_object=include_object)
+
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL позволяет читать во время записи, а synchronous=NORMAL убирает fsync на каждый commit
+    (в режиме WAL это безопасно). busy_timeout задается через connect_args (см. engine_options)
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def create_app(config=None):
+    """
+    config - словарь с настройками поверх Config (переменных окружения)
+    """
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
+    app.config.from_object(Config)
+    if config:
+        app.config.from_mapping(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
     db.init_app(app)
     migrate.init_app(app, db)
+    tenants.init_app(app)
+
+    from .schemas import ORJSONProvider, orjson
+    if orjson is not None and app.config['JSON_ORJSON']:
+        app.json = ORJSONProvider(app)
+
+    from .instrumentation import metrics
+    metrics.init_app(app)
+
+    from .cache import cache
+    cache.init_app(app)
+
+    from .write_queue import write_queue
+    write_queue.init_app(app)
+
+    from .auth import auth
+    auth.init_app(app)
+
+    from .idempotency import idempotency
+    idempotency.init_app(app)
+
+    from .scheduler import scheduler
+    scheduler.init_app(app)
 
     from .routes import routes
     app.register_blueprint(routes)
@@ -20,4 +80,28 @@ def create_app():
     from .api import api
     app.register_blueprint(api)
 
+    from .photos import photos
+    app.register_blueprint(photos)
+
+    from .commands import commands
+    app.register_blueprint(commands)
+
+    from .events import broker, listeners
+    broker.configure(check_interval=app.config['EVENTS_CHECK_INTERVAL'])
+    listeners.init_app(app)
+
+    from .presence import presence
+    presence.configure(check_interval=app.config['PRESENCE_CHECK_INTERVAL'])
+    if tenants.enabled:
+        # кэш присутствия организации прогреется при первом ее запросе
+        return app
+
+    with app.app_context():
+        try:
+            presence.warm()
+        except (OperationalError, ProgrammingError):
+            # таблиц еще нет (первый запуск), кэш прогреется при первом чтении
+            db.session.rollback()
+        db.session.remove()
+
     return app
@@ -1,3 +1,8 @@
+import re
+from typing import Iterable, Iterator
+from flask import json
+
+
 def filled_or_empty(line: str) -> str | None:
     """
     Эта функция принимает строку и
@@ -9,3 +14,36 @@ def filled_or_empty(line: str) -> str | None:
     if not line:
         return None
     return line
+
+
+_NOT_HEX = re.compile(r'[^0-9a-f]')
+
+
+def normalize_mac(mac: str) -> str | None:
+    """
+    MAC-адрес в виде 'aa:bb:cc:dd:ee:ff' из любой записи ('AA-BB-CC-DD-EE-FF', 'aabb.ccdd.eeff', ...),
+    None - если это не MAC-адрес
+    """
+    digits = _NOT_HEX.sub('', mac.lower())
+    if len(digits) != 12 or len(mac) > 17:
+        return None
+    return ':'.join(digits[index:index + 2] for index in range(0, 12, 2))
+
+
+def json_page(key: str, rows: Iterable[dict], limit: int) -> Iterator[str]:
+    """
+    Генератор JSON-страницы вида {"<key>": [...], "next_cursor": <id>}.
+
+    rows - до limit + 1 словарей с ключом 'id', упорядоченных по id.
+    Лишняя (limit + 1)-я строка не отдается, а означает, что есть следующая страница.
+    Строки сериализуются по одной, список страницы целиком в памяти не собирается.
+    """
+    yield f'{{"{key}": ['
+    last_id = None
+    for number, row in enumerate(rows):
+        if number == limit:
+            yield f'], "next_cursor": {last_id}}}'
+            return
+        yield (',' if number else '') + json.dumps(row)
+        last_id = row['id']
+    yield '], "next_cursor": null}'
@@ -1,238 +1,382 @@
-from flask import Blueprint, jsonify, request
-from .models import Staff, Marker, Department
-from .additional_functions import filled_or_empty
+import json
+import math
+import concurrent.futures
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+from .models import Staff, Marker, Department, Device, SessionToken, SEARCH_PAGE_SIZE
+from .additional_functions import json_page
+from .schemas import ValidationError
+from .events import broker, listeners
+from .cache import cache
+from .write_queue import write_queue
+from .auth import auth, token_hash, TOKEN_COOKIE
+from .idempotency import idempotency
+from . import photos, reports, schemas, staff_import
 
 
 api = Blueprint('api', __name__)
 
+MARKER_BATCH_SIZE = 1000
+EVENTS_POLL_TIMEOUT = 25
+EVENTS_HEARTBEAT = 15
 
-@api.get('/api/v1/loadPhoto')
-def load_photo():
-    pass
 
+PUBLIC_ENDPOINTS = {'api.login'}
+
+
+@api.before_request
+def authenticate():
+    if request.endpoint not in PUBLIC_ENDPOINTS:
+        return auth.authenticate()
+
+
+@api.errorhandler(ValidationError)
+def validation_error(error):
+    return jsonify({'status': error.status}), error.code
+
+
+@api.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    return jsonify({'status': 'request too large'}), 413
+
+
+def json_body():
+    return request.get_json(silent=True)
 
-@api.get('/api/v1/createStaff')
-def create_staff():
-    data = request.get_json()
-    photo = data['photo']
-    appointment = data['appointment']
-    firstname = data['department_id']
-    lastname = data['lastname']
-    middle_name = data['middle_name']
-    phone = data['phone']
-    email = data['email']
-    gender = data['gender']  # True/False
-    at_work = data['at_work']  # '07:00'
-    from_work = data['from_work']  # '20:00'
-    password = data['password']
-    admin = data['admin']  # True/False
 
+def page_params(data):
+    """
+    Курсор и размер страницы из запроса (ValidationError при мусоре)
+    """
     try:
-        department_id = int(data['department_id'])
-    except TypeError:
-        department_id = None
-
-    status = Staff.create_staff(photo=photo,
-                                appointment=appointment,
-                                firstname=firstname,
-                                lastname=lastname,
-                                middle_name=middle_name,
-                                phone=phone,
-                                email=email,
-                                gender=gender,
-                                at_work=at_work,
-                                from_work=from_work,
-                                password=password,
-                                active=True,
-                                admin=admin,
-                                department_id=department_id)
+        cursor = schemas.integer(data.get('cursor') or 0)
+        limit = schemas.integer(data.get('limit') or current_app.config['PAGE_SIZE'])
+    except (TypeError, ValueError):
+        raise ValidationError('cursor') from None
+    if limit < 1:
+        raise ValidationError('limit')
+    return cursor, min(limit, current_app.config['MAX_PAGE_SIZE'])
 
+
+def stream_page(key, rows, limit):
+    return Response(stream_with_context(json_page(key, rows, limit)), mimetype='application/json')
+
+
+@api.post('/api/v1/login')
+def login():
+    session = Staff.login(**schemas.LOGIN.load(json_body()))
+    if not session:
+        return jsonify({'status': 'wrong phone or password'}), 401
+
+    response = jsonify({'status': 'ok', **session})
+    response.set_cookie(TOKEN_COOKIE, session['token'], max_age=int(auth.token_ttl.total_seconds()),
+                        httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+
+@api.post('/api/v1/logout')
+def logout():
+    token = auth.request_token()
+    status = SessionToken.logout(token_hash=token_hash(token)) if token else None
+    if token:
+        auth.forget(token)
+
+    response = jsonify({'status': status})
+    response.delete_cookie(TOKEN_COOKIE)
+    return response
+
+
+@api.get('/api/v1/createStaff')
+@auth.admin_required
+def create_staff():
+    status = Staff.create_staff(**schemas.STAFF_CREATE.load(json_body()))
     return jsonify({'status': status})
 
 
 @api.get('/api/v1/editStaff')
+@auth.admin_required
 def edit_staff():
-    data = request.get_json()
-    photo = data['photo']
-    appointment = data['appointment']
-    firstname = data['department_id']
-    lastname = data['lastname']
-    middle_name = data['middle_name']
-    phone = data['phone']
-    email = data['email']
-    gender = data['gender']  # True/False
-    at_work = data['at_work']  # '07:00'
-    from_work = data['from_work']  # '20:00'
-    password = data['password']
-    admin = data['admin']  # True/False
-    active = data['active']
+    data = json_body()
+    status = Staff.edit_staff(schemas.STAFF_ID.load(data)['staff_id'], **schemas.STAFF_EDIT.load(data))
+    return jsonify({'status': status})
+
+
+@api.post('/api/v1/loadPhoto')
+def load_photo():
+    request.max_content_length = photos.upload_limit()
+    staff_id = schemas.STAFF_ID.load(request.form)['staff_id']
+    if not auth.may_act_for(staff_id):
+        return jsonify({'status': 'access denied'}), 403
+
+    file = request.files.get('photo')
+    if not file:
+        return jsonify({'status': 'not value'}), 400
+
+    name = photos.save_photo(file.stream)
+    if not name:
+        return jsonify({'status': 'jpeg, png or webp up to the size limit required'}), 400
+
+    status = Staff.set_photo(staff_id=staff_id, photo=name)
+    return jsonify({'status': status, 'photo': photos.photo_url(name), 'thumbnail': photos.thumbnail_url(name)})
+
+
+@api.post('/api/v1/importStaff')
+@auth.admin_required
+def import_staff():
+    file = request.files.get('file')
+    if not file or not file.filename.endswith(('.csv', '.json', '.jsonl')):
+        return jsonify({'status': 'csv, json or jsonl file required'}), 400
 
     try:
-        department_id = int(data['department_id'])
-    except TypeError:
-        department_id = None
-
-    status = Staff.create_staff(
-                                photo=photo,
-                                appointment=appointment,
-                                firstname=firstname,
-                                lastname=lastname,
-                                middle_name=middle_name,
-                                phone=phone,
-                                email=email,
-                                gender=gender,
-                                at_work=at_work,
-                                from_work=from_work,
-                                password=password,
-                                active=active,
-                                admin=admin,
-                                department_id=department_id)
+        report = staff_import.import_staff(staff_import.read_rows(file.stream, file.filename))
+    except (ValueError, UnicodeDecodeError) as error:
+        return jsonify({'status': f'{error}'}), 400
 
-    return jsonify({'status': status})
+    imported = sum(1 for item in report if item['status'] == 'ok')
+    return jsonify({'status': 'ok', 'imported': imported, 'failed': len(report) - imported, 'rows': report})
 
 
 @api.get('/api/v1/getStaff')
+@cache.cached('staff')
 def get_staff():
-    data = request.get_json()
-    try:
-        staff_id = int(data['staff_id'])
-    except TypeError:
-        return jsonify({'status': 'unacceptable value'}), 406
-
-    status = Staff.get_staff(staff_id=staff_id)
+    status = Staff.get_staff(**schemas.STAFF_ID.load(json_body()))
     return jsonify({'status': status})
 
 
 @api.get('/api/v1/addInDepartment')
+@auth.admin_required
 def add_in_department():
-    data = request.get_json()
-    try:
-        department_id = int(data['department_id'])
-        staff_id = int(data['staff_id'])
-    except TypeError:
-        return jsonify({'status': 'unacceptable value'}), 406
+    status = Staff.add_in_department(**schemas.STAFF_IN_DEPARTMENT.load(json_body()))
+    return jsonify({'status': status})
+
 
-    status = Staff.add_in_department(department_id=department_id, staff_id=staff_id)
+@api.get('/api/v1/addDevice')
+@auth.admin_required
+def add_device():
+    status = Device.add_device(**schemas.DEVICE.load(json_body()))
     return jsonify({'status': status})
 
 
 @api.get('/api/v1/getStaffsFromDepartment')
+@cache.cached('staff')
 def get_staffs_from_department():
-    data = request.get_json()
-    try:
-        department_id = int(data['department_id'])
-    except TypeError:
-        return jsonify({'status': 'unacceptable value'}), 406
+    data = json_body()
+    params = schemas.DEPARTMENT_PAGE.load(data)
+    cursor, limit = page_params(data)
 
-    status = Staff.get_staffs_from_department(department_id=department_id)
-    return jsonify({'status': status})
+    staffs = Staff.get_staffs_from_department(**params, cursor=cursor, limit=limit)
+    return stream_page('status', staffs, limit)
 
 
 @api.get('/api/v1/searchStaff')
+@cache.cached('staff')
 def search_staff():
-    data = request.get_json()
-    query = filled_or_empty(data['q'])
-    if not query:
-        return jsonify({'status': 'not value'}), 400
-
-    status = Staff.search_staff(query=query)
+    params = schemas.SEARCH.load(json_body())
+    params['per_page'] = params['per_page'] or SEARCH_PAGE_SIZE
+
+    status = Staff.search_staff(**params)
+    return jsonify({'status': status, 'page': params['page']})
+
+
+def write_marker(action):
+    """
+    markerIn/markerOut: повтор с тем же Idempotency-Key отвечает без записи (см. idempotency.py),
+    иначе маркер пишется сразу или через очередь с групповым commit
+    """
+    params = schemas.MARKER_EVENT.load(json_body())
+    staff_id = params['staff_id']
+    if not auth.may_act_for(staff_id):
+        return jsonify({'status': 'access denied'}), 403
+
+    key = schemas.IDEMPOTENCY_KEY.load(dict(request.headers))['key']
+    if key:
+        replayed = idempotency.begin(staff_id, action, key)
+        if replayed is not None:
+            status, code = replayed
+            return jsonify({'status': status}), code, {'Idempotent-Replayed': 'true'} if code == 200 else {}
+
+    status = None
+    try:
+        if write_queue.enabled:
+            future = write_queue.submit(staff_id=staff_id, reason=params['reason'], action=action,
+                                        idempotency_key=key)
+            try:
+                status = future.result(timeout=write_queue.timeout)
+            except concurrent.futures.TimeoutError:
+                return jsonify({'status': 'timeout'}), 503
+            except Exception:
+                # ошибка записи всей пачки (например, database is locked) - клиент может повторить
+                current_app.logger.exception('marker write failed, staff %s', staff_id)
+                return jsonify({'status': 'write failed'}), 503
+        elif action == 'in':
+            status = Marker.marker_in(staff_id=staff_id, reason_in=params['reason'], idempotency_key=key)
+        else:
+            status = Marker.marker_out(staff_id=staff_id, reason_out=params['reason'], idempotency_key=key)
+    finally:
+        if key:
+            idempotency.finish(staff_id, action, key, status)
     return jsonify({'status': status})
 
 
 @api.get('/api/v1/markerIn')
 def marker_in():
-    data = request.get_json()
-
-    try:
-        staff_id = int(data['staff'])
-        reason_in = filled_or_empty(data['reason'])
-    except TypeError:
-        return jsonify({'status': 'unacceptable value'}), 406
-
-    status = Marker.marker_in(staff_id=staff_id, reason_in=reason_in)
-    return jsonify({'status': status})
+    return write_marker('in')
 
 
 @api.get('/api/v1/markerOut')
 def marker_out():
-    data = request.get_json()
+    return write_marker('out')
 
-    try:
-        staff_id = int(data['staff'])
-        reason_out = filled_or_empty(data['reason'])
-    except TypeError:
-        return jsonify({'status': 'unacceptable value'}), 406
 
-    status = Marker.marker_out(staff_id=staff_id, reason_out=reason_out)
+@api.get('/api/v1/markerBatch')
+@auth.admin_required
+def marker_batch():
+    events = schemas.MARKER_BATCH.load(json_body())['events']
+    if len(events) > MARKER_BATCH_SIZE:
+        return jsonify({'status': 'too many events'}), 400
+
+    status = Marker.marker_batch(events=events)
     return jsonify({'status': status})
 
 
 @api.get('/api/v1/editMarker')
+@auth.admin_required
 def edit_marker():
-    data = request.get_json()
-
-    try:
-        marker_id = int(data['marker_id'])
-        time_in = filled_or_empty(data['time_in'])
-        reason_in = filled_or_empty(data['reason_in'])
-        time_out = filled_or_empty(data['time_out'])
-        reason_out = filled_or_empty(data['reason_out'])
-    except TypeError:
-        return jsonify({'status': 'unacceptable value'}), 406
-
-    status = Marker.edit_marker(marker_id=marker_id, reason_in=reason_in, reason_out=reason_out,
-                                time_in=time_in, time_out=time_out)
+    status = Marker.edit_marker(**schemas.MARKER_EDIT.load(json_body()))
     return jsonify({'status': status})
 
 
 @api.get('/api/v1/todayMarkers')
+@cache.cached('marker')
 def today_markers():
-    status = Marker.today_markers()
-    return jsonify({'data': status})
+    cursor, limit = page_params(request.args)
+    markers = Marker.today_markers(cursor=cursor, limit=limit)
+    return stream_page('data', markers, limit)
+
+
+@api.get('/api/v1/markerEvents')
+def marker_events():
+    """
+    Long-poll: ждет изменений маркеров после курсора since (не дольше timeout секунд)
+    """
+    try:
+        timeout = float(request.args.get('timeout', EVENTS_POLL_TIMEOUT))
+    except ValueError:
+        return jsonify({'status': 'unacceptable value'}), 406
+    if not math.isfinite(timeout):
+        # nan и inf держали бы поток воркера до следующего события
+        return jsonify({'status': 'unacceptable value'}), 406
+    timeout = min(max(timeout, 0), EVENTS_POLL_TIMEOUT)
+
+    if not listeners.acquire():
+        # все потоки для ожидания событий заняты: отвечаем сразу, клиент спросит снова
+        events, cursor, reset = broker.wait(request.args.get('since'), timeout=0)
+        return jsonify({'events': [payload for _, payload in events], 'cursor': cursor, 'reset': reset})
+    try:
+        events, cursor, reset = broker.wait(request.args.get('since'), timeout=timeout)
+    finally:
+        listeners.release()
+    return jsonify({'events': [payload for _, payload in events], 'cursor': cursor, 'reset': reset})
+
+
+@api.get('/api/v1/markerStream')
+def marker_stream():
+    """
+    Server-sent events с изменениями маркеров, курсор берется из Last-Event-ID
+    """
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if not listeners.acquire():
+        # поток держится все время соединения: остальные оставляем для отметок, клиенту - long-poll
+        return jsonify({'status': 'too many listeners'}), 503, {'Retry-After': '30'}
+
+    events_of = broker.get()
+
+    def generate(cursor):
+        if not cursor:
+            _, cursor, _ = events_of.wait(timeout=0)
+        yield f'retry: 3000\nid: {cursor}\n\n'
+        while True:
+            events, cursor, reset = events_of.wait(cursor, timeout=EVENTS_HEARTBEAT)
+            if reset:
+                yield f'event: reset\nid: {cursor}\ndata: {{}}\n\n'
+            elif not events:
+                yield ': keepalive\n\n'
+            for seq, payload in events:
+                yield f'id: {seq}\ndata: {json.dumps(payload)}\n\n'
+
+    # журнал читается из генератора, поэтому ему нужен контекст запроса
+    response = Response(stream_with_context(generate(cursor)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(listeners.release)
+    return response
 
 
 @api.get('/api/v1/createMarkerByAdmin')
+@auth.admin_required
 def create_marker_by_admin():
-    data = request.get_json()
+    status = Marker.create_marker_by_admin(**schemas.MARKER_BY_ADMIN.load(json_body()))
+    return jsonify({'status': status})
 
-    try:
-        staff_id = int(data['marker_id'])
-        reason_in = filled_or_empty(data['reason_in'])
-        reason_out = filled_or_empty(data['reason_out'])
-        time_in = filled_or_empty(data['time_in'])  # '%Y-%m-%d %H:%M'
-        time_out = filled_or_empty(data['time_out'])  # '%Y-%m-%d %H:%M'
-    except TypeError:
+
+@api.get('/api/v1/attendanceReport')
+@auth.admin_required
+def attendance_report():
+    params = schemas.ATTENDANCE_REPORT.load(json_body())
+    if params['date_from'] > params['date_to']:
         return jsonify({'status': 'unacceptable value'}), 406
 
-    status = Marker.create_marker_by_admin(staff_id=staff_id, reason_in=reason_in, reason_out=reason_out,
-                                           time_in=time_in, time_out=time_out)
+    status = reports.attendance_report(**params)
     return jsonify({'status': status})
 
 
-@api.get('/api/v1/createDepartment')
-def create_department():
-    data = request.get_json()
-
-    title = data['title']
-    if not title or len(title) > 25:
-        return jsonify({'status': 'no value or too long'}), 400
+@api.get('/api/v1/presenceDashboard')
+@auth.admin_required
+@cache.cached('marker', 'staff', 'department')
+def presence_dashboard():
+    department_id = schemas.PRESENCE_DASHBOARD.load(request.args)['department_id']
 
-    status = Department.create_department(title=title)
+    status = cache.memoize(('presenceDashboard', department_id), ('marker', 'staff', 'department'),
+                           lambda: reports.presence_dashboard(department_id=department_id),
+                           ttl=current_app.config['PRESENCE_DASHBOARD_TTL'])
     return jsonify({'status': status})
 
 
-@api.get('/api/v1/editDepartment')
-def edit_department():
-    data = request.get_json()
-
-    try:
-        department_id = int(data['department_id'])
-    except TypeError:
+@api.get('/api/v1/exportTimesheet')
+@auth.admin_required
+def export_timesheet():
+    params = schemas.TIMESHEET.load(request.args)
+    date_from, date_to, export_format = params['date_from'], params['date_to'], params['export_format']
+    if date_from > date_to:
         return jsonify({'status': 'unacceptable value'}), 406
 
-    title = data['title']
-    if not title or len(title) > 25:
-        return jsonify({'status': 'no value or too long'}), 400
+    filename = f'timesheet_{date_from:%Y%m%d}_{date_to:%Y%m%d}.{export_format}'
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+
+    if export_format == 'csv':
+        return Response(stream_with_context(reports.timesheet_csv(date_from, date_to)),
+                        mimetype='text/csv', headers=headers)
 
-    status = Department.edit_department(department_id=department_id, title=title)
+    if reports.openpyxl is None:
+        return jsonify({'status': 'xlsx export requires openpyxl'}), 501
+    # книга XLSX собирается целиком до ответа - длинные периоды выгружаются в CSV
+    if (date_to - date_from).days >= current_app.config['TIMESHEET_XLSX_MAX_DAYS']:
+        return jsonify({'status': 'period too long for xlsx, use csv'}), 400
+
+    return Response(stream_with_context(reports.timesheet_xlsx(date_from, date_to)),
+                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers=headers)
+
+
+@api.get('/api/v1/createDepartment')
+@auth.admin_required
+def create_department():
+    status = Department.create_department(**schemas.DEPARTMENT.load(json_body()))
+    return jsonify({'status': status})
+
+
+@api.get('/api/v1/editDepartment')
+@auth.admin_required
+def edit_department():
+    status = Department.edit_department(**schemas.DEPARTMENT_EDIT.load(json_body()))
+    if status == 'did not come':
+        return jsonify({'status': status}), 404
     return jsonify({'status': status})
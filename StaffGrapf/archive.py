@@ -0,0 +1,113 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, Table, Text, func, select, union_all
+from . import db
+from .models import Marker, MarkerArchive
+from .cache import cache
+
+
+ARCHIVE_PREFIX = 'marker_archive_'
+ARCHIVE_CHUNK_SIZE = 1000
+MARKER_COLUMNS = ('id', 'time_in', 'reason_in', 'time_out', 'reason_out', 'staff_id')
+
+# архивные таблицы создаются по мере надобности и не входят в db.metadata (create_all, миграции)
+archive_metadata = MetaData()
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def today_start():
+    return datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+
+
+def archive_table(month):
+    """
+    Таблица архива маркеров за месяц: marker_archive_YYYYMM, столбцы как у marker
+    """
+    name = f'{ARCHIVE_PREFIX}{month:%Y%m}'
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+
+    return Table(
+        name, archive_metadata,
+        Column('id', Integer, primary_key=True),
+        Column('time_in', DateTime),
+        Column('reason_in', Text),
+        Column('time_out', DateTime),
+        Column('reason_out', Text),
+        Column('staff_id', Integer, nullable=False),
+        Index(f'ix_{name}_time_in', 'time_in'),
+        Index(f'ix_{name}_staff_id', 'staff_id')
+    )
+
+
+def marker_source(start, end, staff_ids=None):
+    """
+    Маркеры с time_in в [start, end) как подзапрос со столбцами marker.
+
+    Если в период попадают заархивированные месяцы, к горячей таблице marker
+    добавляются (UNION ALL) их архивные таблицы; фильтры применяются внутри
+    каждой части, чтобы работали индексы. Маркеры текущего дня не архивируются,
+    поэтому для периода с сегодняшнего дня (пересчет сводки при отметке) архив не проверяется
+    """
+    months = []
+    if start < today_start():
+        months = [month for month, in db.session.query(MarkerArchive.month)
+                  .filter(MarkerArchive.month >= month_start(start), MarkerArchive.month < end)]
+
+    def part(table):
+        query = select(*[table.c[column] for column in MARKER_COLUMNS]) \
+            .where(table.c.time_in >= start, table.c.time_in < end)
+        if staff_ids is not None:
+            query = query.where(table.c.staff_id.in_(staff_ids))
+        return query
+
+    parts = [part(Marker.__table__)] + [part(archive_table(month)) for month in months]
+    if len(parts) == 1:
+        return parts[0].subquery('markers')
+    return union_all(*parts).subquery('markers')
+
+
+def archive_markers(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Перенести закрытые маркеры с time_in < cutoff в помесячные архивные таблицы.
+    Каждая порция из chunk_size маркеров переносится своей короткой транзакцией.
+    Генератор, отдает число перенесенных маркеров по каждой порции
+    """
+    hot = Marker.__table__
+    # маркеры текущего дня остаются в marker: на это рассчитывает marker_source
+    cutoff = min(cutoff, today_start())
+    # последний маркер не трогаем, чтобы SQLite не выдал его id повторно
+    last_id = db.session.query(func.max(hot.c.id)).scalar()
+
+    while last_id is not None:
+        rows = db.session.execute(
+            select(hot).where(hot.c.time_out != None, hot.c.time_in < cutoff, hot.c.id < last_id)
+            .order_by(hot.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[month_start(row['time_in'])].append(dict(row))
+
+        for month, month_rows in by_month.items():
+            table = archive_table(month)
+            table.create(db.session.connection(), checkfirst=True)
+            db.session.execute(table.insert(), month_rows)
+
+            archive = db.session.get(MarkerArchive, month)
+            if archive is None:
+                archive = MarkerArchive(month=month, table_name=table.name, rows=0)
+                db.session.add(archive)
+            archive.rows += len(month_rows)
+
+        db.session.execute(hot.delete().where(hot.c.id.in_([row['id'] for row in rows])))
+        db.session.commit()
+        cache.bump('marker')
+        yield len(rows)
+
+    db.session.remove()
@@ -0,0 +1,162 @@
+import os
+import hmac
+import hashlib
+import datetime
+from functools import partial, wraps
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, jsonify, request
+from werkzeug.security import check_password_hash, generate_password_hash
+from .cache import TTLCache
+from .tenants import tenants
+
+
+TOKEN_COOKIE = 'token'
+HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+
+Identity = namedtuple('Identity', 'staff_id admin')
+
+
+def token_hash(token):
+    """
+    В базе хранится только sha256 токена: утечка таблицы не дает действующих сессий
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class Auth:
+    """
+    Пароли и сессии API.
+
+    Пароли хранятся солеными хэшами werkzeug, стоимость задается методом PASSWORD_HASH_METHOD
+    (например 'scrypt:32768:8:1' или 'pbkdf2:sha256:600000'). Пароль, сохраненный открытым текстом
+    или другим методом, перехэшируется при успешном входе. Импорт персонала хэширует методом
+    IMPORT_PASSWORD_HASH_METHOD (по умолчанию тем же PASSWORD_HASH_METHOD).
+
+    Токен сессии выдается при входе (Authorization: Bearer <token> или cookie token).
+    Токен -> (staff_id, admin) запоминается в TTL-кэше на token_cache_ttl секунд, поэтому
+    проверка доступа обычно не ходит в базу. Выход или смена прав в другом воркере
+    видны в этом не позже чем через token_cache_ttl секунд
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.method = 'scrypt:32768:8:1'
+        self.import_method = self.method
+        self.token_ttl = datetime.timedelta(days=30)
+        self._tokens = TTLCache()
+        self._dummy_hash = None
+        self._pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='password-hash')
+
+    def init_app(self, app):
+        self.enabled = app.config['AUTH_ENABLED']
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.import_method = app.config['IMPORT_PASSWORD_HASH_METHOD'] or self.method
+        self.token_ttl = datetime.timedelta(days=app.config['SESSION_TOKEN_DAYS'])
+        self._tokens = TTLCache(app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+        self._dummy_hash = None
+
+    # пароли
+
+    def hash_password(self, password, method=None):
+        return generate_password_hash(password, method=method or self.method, salt_length=16)
+
+    def hash_passwords(self, passwords):
+        """
+        Хэши для пачки паролей (импорт) методом import_method; хэширование отпускает GIL,
+        поэтому идет в потоках по числу ядер
+        """
+        return list(self._pool.map(partial(self.hash_password, method=self.import_method), passwords))
+
+    @staticmethod
+    def is_hash(value):
+        """
+        Похоже ли значение на готовый хэш werkzeug ('метод$соль$хэш')
+        """
+        return value.startswith(HASH_PREFIXES) and value.count('$') == 2
+
+    def check_password(self, stored, password):
+        if not stored or not password:
+            return False
+        if stored.startswith(HASH_PREFIXES):
+            return check_password_hash(stored, password)
+        return hmac.compare_digest(stored.encode(), password.encode())
+
+    def needs_rehash(self, stored):
+        return not stored.startswith(HASH_PREFIXES) or stored.split('$', 1)[0] != self.method
+
+    def burn(self, password):
+        """
+        Проверка пароля против фиктивного хэша: вход с неизвестным логином идет столько же,
+        сколько с неверным паролем
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash_password('dummy password')
+        check_password_hash(self._dummy_hash, password or '')
+
+    # сессии
+
+    def resolve(self, token):
+        """
+        Identity по токену сессии или None
+        """
+        from .models import SessionToken
+
+        digest = token_hash(token)
+        key = (tenants.current(), digest)
+        identity = self._tokens.get(key, False)
+        if identity is not False:
+            return identity
+
+        row = SessionToken.identity(digest)
+        if row is None:
+            self._tokens.set(key, None)
+            return None
+
+        remaining = (row.expires - datetime.datetime.now()).total_seconds()
+        identity = Identity(row.staff_id, row.admin)
+        self._tokens.set(key, identity, ttl=min(self._tokens.ttl, remaining))
+        return identity
+
+    def forget(self, token):
+        self._tokens.pop((tenants.current(), token_hash(token)))
+
+    @staticmethod
+    def request_token():
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            return header[7:].strip() or None
+        return request.cookies.get(TOKEN_COOKIE)
+
+    def authenticate(self):
+        """
+        before_request: кладет Identity в g.identity или отвечает 401
+        """
+        g.identity = None
+        if not self.enabled:
+            return None
+
+        token = self.request_token()
+        g.identity = self.resolve(token) if token else None
+        if g.identity is None:
+            return jsonify({'status': 'unauthorized'}), 401
+        return None
+
+    def may_act_for(self, staff_id):
+        """
+        Отмечать сотрудника и менять его фото может он сам или администратор
+        """
+        identity = g.get('identity')
+        return identity is None or identity.admin or identity.staff_id == staff_id
+
+    def admin_required(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            identity = g.get('identity')
+            if self.enabled and (identity is None or not identity.admin):
+                return jsonify({'status': 'access denied'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+
+
+auth = Auth()
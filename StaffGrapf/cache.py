@@ -0,0 +1,242 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, request
+from .tenants import tenants
+
+
+class ResponseCache:
+    """
+    Кэш ответов читающих эндпоинтов с ETag/304.
+
+    Ключ - организация, эндпоинт, тело и строка запроса. У каждой таблицы организации есть счетчик версий,
+    который методы записи моделей увеличивают после commit (bump). Запись кэша
+    и ETag действительны, пока не изменились версии таблиц, от которых зависит эндпоинт,
+    поэтому If-None-Match проверяется без обращения к базе.
+    Счетчики живут в памяти процесса, поэтому записи дополнительно живут не дольше ttl
+    секунд: столько может быть не видна запись, сделанная другим воркером.
+    ETag - sha1 тела ответа, поэтому он одинаков во всех воркерах и после истечения ttl:
+    If-None-Match с прежним ETag получает 304, если ответ не изменился.
+    Потоковый ответ до max_body байт собирается целиком, больший отдается потоком
+    без ETag и не кэшируется.
+    """
+
+    def __init__(self, max_entries=1024, ttl=5.0, max_body=256 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_body = max_body
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._entries = OrderedDict()
+        self._values = OrderedDict()
+        self._pending = {}
+
+    def init_app(self, app):
+        self.max_entries = app.config['RESPONSE_CACHE_SIZE']
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+
+    def bump(self, *tables):
+        tenant = tenants.current()
+        with self._lock:
+            for table in tables:
+                self._versions[tenant, table] = self._versions.get((tenant, table), 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._values.clear()
+
+    def versions(self, *tables):
+        tenant = tenants.current()
+        with self._lock:
+            return tuple(((tenant, table), self._versions.get((tenant, table), 0)) for table in tables)
+
+    def memoize(self, key, tables, compute, ttl):
+        """
+        Значение compute() для key, пока не изменились таблицы tables и не прошло ttl секунд.
+
+        Single-flight: если значение уже считается в другом потоке, запрос ждет его,
+        а не считает заново - одновременные запросы стоят одного вычисления
+        """
+        key = (tenants.current(), key)
+        while True:
+            versions = self.versions(*tables)
+            with self._lock:
+                entry = self._values.get(key)
+                if entry is not None and entry[0] == versions and time.monotonic() - entry[1] <= ttl:
+                    self._values.move_to_end(key)
+                    return entry[2]
+
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+
+            # значение считает другой поток; если он упал, следующий круг посчитает заново
+            pending.wait()
+
+        try:
+            created = time.monotonic()
+            value = compute()
+            with self._lock:
+                self._values[key] = (versions, created, value)
+                self._values.move_to_end(key)
+                while len(self._values) > self.max_entries:
+                    self._values.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def _get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['versions'] != versions or time.monotonic() - entry['created'] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def etag(body):
+        return hashlib.sha1(body).hexdigest()
+
+    def _put(self, key, versions, etag, response, body, created):
+        with self._lock:
+            if versions != tuple((table, self._versions.get(table, 0)) for table, _ in versions):
+                # пока строился ответ, таблицы изменились
+                return
+            self._entries[key] = {'versions': versions, 'etag': etag, 'body': body, 'created': created,
+                                  'status': response.status_code, 'mimetype': response.mimetype}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read(self, body):
+        """
+        Прочитать потоковое тело, если оно не больше max_body: (байты, None),
+        иначе (прочитанные куски, итератор с остатком)
+        """
+        chunks = []
+        size = 0
+        iterator = iter(body)
+        for chunk in iterator:
+            chunk = chunk.encode() if isinstance(chunk, str) else chunk
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_body:
+                return chunks, self._rest(chunks, iterator, body)
+        return b''.join(chunks), None
+
+    @staticmethod
+    def _rest(chunks, iterator, body):
+        try:
+            yield from chunks
+            yield from iterator
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def cached(self, *tables):
+        """
+        Декоратор эндпоинта, ответ которого зависит только от таблиц tables и параметров запроса
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (tenants.current(), request.endpoint, request.query_string, request.get_data())
+                versions = self.versions(*tables)
+
+                entry = self._get(key, versions)
+                if entry is not None:
+                    if entry['etag'] in request.if_none_match:
+                        return Response(status=304, headers={'ETag': f'"{entry["etag"]}"'})
+                    response = Response(entry['body'], status=entry['status'], mimetype=entry['mimetype'])
+                    response.set_etag(entry['etag'])
+                    return response
+
+                created = time.monotonic()
+                response = view(*args, **kwargs)
+                if isinstance(response, tuple) or response.status_code != 200:
+                    return response
+
+                if response.is_streamed:
+                    body, rest = self._read(response.response)
+                    if rest is not None:
+                        response.response = rest
+                        return response
+                    response.set_data(body)
+
+                body = response.get_data()
+                etag = self.etag(body)
+                if len(body) <= self.max_body:
+                    self._put(key, versions, etag, response, body, created)
+                if etag in request.if_none_match:
+                    # ответ из другого воркера или из истекшей записи, но тело то же
+                    return Response(status=304, headers={'ETag': f'"{etag}"'})
+                response.set_etag(etag)
+                return response
+
+            return wrapper
+        return decorator
+
+
+class TTLCache:
+    """
+    Ограниченный (LRU) словарь в памяти процесса, записи живут не дольше ttl секунд
+    """
+
+    def __init__(self, max_entries=10000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """
+        Записать, только если живой записи нет. True - записали
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return False
+            self._put(key, value, ttl)
+            return True
+
+    def _put(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache()
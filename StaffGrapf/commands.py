@@ -0,0 +1,145 @@
+import datetime
+from functools import wraps
+import click
+import flask_migrate
+from flask import Blueprint, current_app
+from sqlalchemy import func
+from . import archive, db, scheduler, staff_import, wifi
+from .models import Marker, MarkerDay, Staff
+from .tenants import tenants
+
+
+commands = Blueprint('commands', __name__, cli_group=None)
+
+
+def tenant_option(command):
+    """
+    Опция --tenant: команда работает с базой организации (обязательна, если заданы организации)
+    """
+    @click.option('--tenant', help='Организация (при заданном TENANT_DATABASE_URL)')
+    @wraps(command)
+    def wrapper(tenant, **kwargs):
+        if tenants.enabled and not tenants.known(tenant):
+            raise click.UsageError(f'неизвестная организация: {tenant}' if tenant else 'нужна опция --tenant')
+        if not tenants.enabled and tenant:
+            raise click.UsageError('организации не настроены (TENANT_DATABASE_URL)')
+
+        with tenants.use(tenant):
+            return command(**kwargs)
+    return wrapper
+
+
+@commands.cli.command('rebuild-search')
+@tenant_option
+def rebuild_search():
+    """Создать и перестроить поисковый индекс персонала."""
+    status = Staff.rebuild_search_index()
+    click.echo(status or 'search index is only used on SQLite and PostgreSQL')
+
+
+@commands.cli.command('rebuild-rollup')
+@tenant_option
+@click.option('--date-from', type=click.DateTime(formats=['%Y-%m-%d']), help='По умолчанию - первый маркер')
+@click.option('--date-to', type=click.DateTime(formats=['%Y-%m-%d']), help='По умолчанию - последний маркер')
+def rebuild_rollup(date_from, date_to):
+    """Пересобрать посуточную сводку marker_day по таблице marker."""
+    first, last = db.session.query(func.min(Marker.time_in), func.max(Marker.time_in)).one()
+    if first is None:
+        click.echo('no markers')
+        return
+
+    date_from = (date_from or first).date()
+    date_to = (date_to or last).date()
+    for chunk_from, chunk_to, count in MarkerDay.rebuild(date_from, date_to):
+        click.echo(f'{chunk_from:%Y-%m-%d} - {chunk_to:%Y-%m-%d}: {count}')
+
+
+@commands.cli.command('import-staff')
+@tenant_option
+@click.argument('file', type=click.File('rb'))
+@click.option('--batch-size', default=staff_import.IMPORT_BATCH_SIZE, show_default=True)
+def import_staff(file, batch_size):
+    """Импортировать персонал из .csv, .json или .jsonl файла."""
+    report = staff_import.import_staff(staff_import.read_rows(file, file.name), batch_size=batch_size)
+    failed = [item for item in report if item['status'] != 'ok']
+    for item in failed:
+        click.echo(f'row {item["row"]}: {item["status"]}', err=True)
+    click.echo(f'imported {len(report) - len(failed)}, failed {len(failed)}')
+
+
+@commands.cli.command('archive-markers')
+@tenant_option
+@click.option('--older-than', type=int, help='Возраст в днях, по умолчанию MARKER_ARCHIVE_AFTER_DAYS')
+@click.option('--chunk-size', default=archive.ARCHIVE_CHUNK_SIZE, show_default=True)
+def archive_markers(older_than, chunk_size):
+    """Перенести старые закрытые маркеры в помесячные архивные таблицы."""
+    older_than = older_than or current_app.config['MARKER_ARCHIVE_AFTER_DAYS']
+    cutoff = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=older_than), datetime.time.min)
+
+    moved = 0
+    for count in archive.archive_markers(cutoff, chunk_size=chunk_size):
+        moved += count
+    click.echo(f'archived {moved} markers older than {cutoff:%Y-%m-%d}')
+
+
+@commands.cli.command('close-stale-markers')
+def close_stale_markers():
+    """Закрыть забытые открытые маркеры во всех организациях (то же, что делает фоновый планировщик)."""
+    for tenant in tenants.each():
+        prefix = f'{tenant}: ' if tenant else ''
+        click.echo(f'{prefix}closed {scheduler.close_stale_markers(current_app)} markers')
+
+
+@commands.cli.command('create-tenant')
+@click.argument('name')
+def create_tenant(name):
+    """Создать базу организации NAME (или обновить ее схему) миграциями."""
+    if not tenants.enabled:
+        raise click.UsageError('организации не настроены (TENANT_DATABASE_URL)')
+    try:
+        url = tenants.create(name)
+    except ValueError:
+        raise click.BadParameter('латинские буквы в нижнем регистре, цифры, - и _', param_hint='NAME')
+
+    with tenants.use(name):
+        flask_migrate.upgrade()
+    click.echo(f'{name}: {url.render_as_string()}')
+
+
+@commands.cli.command('upgrade-tenants')
+def upgrade_tenants():
+    """Применить миграции к базам всех организаций."""
+    if not tenants.enabled:
+        raise click.UsageError('организации не настроены (TENANT_DATABASE_URL)')
+    for tenant in tenants.each():
+        flask_migrate.upgrade()
+        click.echo(f'{tenant}: upgraded')
+
+
+@commands.cli.command('ingest-wifi')
+@tenant_option
+@click.option('--file', 'path', type=click.Path(exists=True, dir_okay=False), help='Лог hostapd/RADIUS')
+@click.option('--follow', is_flag=True, help='Ждать новые строки файла, как tail -f')
+@click.option('--udp', help='Слушать syslog по UDP: [HOST:]PORT')
+def ingest_wifi(path, follow, udp):
+    """Отмечать приход/уход по событиям подключения к Wi-Fi."""
+    if bool(path) == bool(udp):
+        raise click.UsageError('нужен ровно один источник: --file или --udp')
+
+    if udp:
+        host, _, port = udp.rpartition(':')
+        lines = wifi.udp_source(host or '0.0.0.0', int(port))
+    else:
+        lines = wifi.file_source(path, follow=follow)
+
+    config = current_app.config
+    ingestor = wifi.WifiIngestor(debounce=config['WIFI_DEBOUNCE'], batch_size=config['WIFI_BATCH_SIZE'],
+                                 flush_interval=config['WIFI_FLUSH_INTERVAL'])
+    try:
+        stats = ingestor.run(lines)
+    except KeyboardInterrupt:
+        ingestor.tick(ingestor.clock())
+        stats = ingestor.stats
+
+    for name, count in sorted(stats.items()):
+        click.echo(f'{name}: {count}')
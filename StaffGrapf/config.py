@@ -0,0 +1,123 @@
+import os
+
+
+class Config:
+    """
+    Настройки приложения, значения берутся из переменных окружения
+    """
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///test.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # организации со своими базами: шаблон адреса с {tenant} (пусто - одна база SQLALCHEMY_DATABASE_URI),
+    # организация запроса берется из заголовка TENANT_HEADER или поддомена TENANT_DOMAIN;
+    # TENANTS - необязательный список организаций через запятую, TENANT_ENGINE_POOL - сколько движков держать открытыми
+    TENANT_DATABASE_URL = os.environ.get('TENANT_DATABASE_URL', '')
+    TENANT_HEADER = os.environ.get('TENANT_HEADER', 'X-Tenant')
+    TENANT_DOMAIN = os.environ.get('TENANT_DOMAIN', '').lower() or None
+    TENANTS = os.environ.get('TENANTS', '')
+    TENANT_ENGINE_POOL = int(os.environ.get('TENANT_ENGINE_POOL', 32))
+
+    # пул соединений для серверных СУБД (PostgreSQL и т.п.)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+
+    # SQLite: сколько миллисекунд ждать снятия блокировки записи
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+
+    # как часто кэш присутствия сверяется с базой, секунды; при нескольких
+    # воркерах это задержка, с которой виден чужой check-in
+    PRESENCE_CHECK_INTERVAL = float(os.environ.get('PRESENCE_CHECK_INTERVAL', 1))
+
+    # учет SQL-запросов по эндпоинтам: заголовки X-DB-* и /metrics (только с Authorization: Bearer METRICS_TOKEN)
+    SQL_METRICS = os.environ.get('SQL_METRICS') == '1'
+    SQL_METRICS_SLOWEST = int(os.environ.get('SQL_METRICS_SLOWEST', 5))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # предельный размер тела запроса (файл импорта персонала); загрузка фото ограничена PHOTO_MAX_SIZE
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+
+    # фото персонала: каталог (по умолчанию instance/photos), предельный размер и сторона миниатюры
+    PHOTO_DIR = os.environ.get('PHOTO_DIR')
+    PHOTO_MAX_SIZE = int(os.environ.get('PHOTO_MAX_SIZE', 10 * 1024 * 1024))
+    PHOTO_THUMBNAIL_SIZE = int(os.environ.get('PHOTO_THUMBNAIL_SIZE', 160))
+
+    # кэш ответов читающих эндпоинтов: число записей и время жизни записи, секунды
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+    RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 5))
+
+    # запись маркеров markerIn/markerOut через очередь с групповым commit
+    MARKER_WRITE_BEHIND = os.environ.get('MARKER_WRITE_BEHIND') == '1'
+    MARKER_WRITE_BATCH_SIZE = int(os.environ.get('MARKER_WRITE_BATCH_SIZE', 500))
+    MARKER_WRITE_LINGER = float(os.environ.get('MARKER_WRITE_LINGER', 0.002))
+    MARKER_WRITE_TIMEOUT = float(os.environ.get('MARKER_WRITE_TIMEOUT', 10))
+
+    # фоновое закрытие забытых маркеров: раз в AUTO_CLOSE_INTERVAL секунд (0 - выключено) закрываются
+    # маркеры, открытые дольше AUTO_CLOSE_GRACE минут после Staff.from_work или AUTO_CLOSE_MAX_SHIFT часов
+    # SCHEDULER_ENABLED=1 запускает фоновые задачи из create_app; gunicorn.conf.py и start_app.py
+    # запускают их сами, в командах flask и бенчмарках фоновых задач нет
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED') == '1'
+    AUTO_CLOSE_INTERVAL = float(os.environ.get('AUTO_CLOSE_INTERVAL', 300))
+    AUTO_CLOSE_GRACE = int(os.environ.get('AUTO_CLOSE_GRACE', 120))
+    AUTO_CLOSE_MAX_SHIFT = int(os.environ.get('AUTO_CLOSE_MAX_SHIFT', 16))
+    AUTO_CLOSE_CHUNK_SIZE = int(os.environ.get('AUTO_CLOSE_CHUNK_SIZE', 500))
+
+    # отметка по Wi-Fi (flask ingest-wifi): уход засчитывается, если устройство не вернулось за WIFI_DEBOUNCE
+    # секунд; события пишутся пакетами до WIFI_BATCH_SIZE не реже раза в WIFI_FLUSH_INTERVAL секунд
+    WIFI_DEBOUNCE = float(os.environ.get('WIFI_DEBOUNCE', 120))
+    WIFI_BATCH_SIZE = int(os.environ.get('WIFI_BATCH_SIZE', 500))
+    WIFI_FLUSH_INTERVAL = float(os.environ.get('WIFI_FLUSH_INTERVAL', 1))
+
+    # вход в API: AUTH_ENABLED=0 выключает проверку токенов; стоимость хэша пароля задается методом werkzeug
+    # ('scrypt:N:r:p' или 'pbkdf2:sha256:iterations'), токен -> сотрудник кэшируется на TOKEN_CACHE_TTL секунд;
+    # импорт персонала хэширует методом IMPORT_PASSWORD_HASH_METHOD (пусто - PASSWORD_HASH_METHOD);
+    # более дешевый метод ускоряет импорт, но хэш остается дешевым до первого входа сотрудника
+    AUTH_ENABLED = os.environ.get('AUTH_ENABLED', '1') == '1'
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    IMPORT_PASSWORD_HASH_METHOD = os.environ.get('IMPORT_PASSWORD_HASH_METHOD', '')
+    SESSION_TOKEN_DAYS = int(os.environ.get('SESSION_TOKEN_DAYS', 30))
+    TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 60))
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+    # ключи идемпотентности markerIn/markerOut (заголовок Idempotency-Key): сколько часов хранятся в базе
+    # и сколько последних ключей процесс помнит в памяти
+    IDEMPOTENCY_KEY_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_HOURS', 24))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 100000))
+
+    # закрытые маркеры старше стольких дней переносятся в помесячные архивные таблицы
+    MARKER_ARCHIVE_AFTER_DAYS = int(os.environ.get('MARKER_ARCHIVE_AFTER_DAYS', 365))
+
+    # ответы сериализуются через orjson, если он установлен
+    JSON_ORJSON = os.environ.get('JSON_ORJSON', '1') == '1'
+
+    # лента событий маркеров (markerEvents/markerStream): как часто воркер дочитывает журнал marker_event, секунды;
+    # сколько потоков воркера могут одновременно ждать событий; сколько часов хранится журнал
+    EVENTS_CHECK_INTERVAL = float(os.environ.get('EVENTS_CHECK_INTERVAL', 1))
+    EVENTS_MAX_LISTENERS = int(os.environ.get('EVENTS_MAX_LISTENERS', 4))
+    MARKER_EVENTS_KEEP_HOURS = int(os.environ.get('MARKER_EVENTS_KEEP_HOURS', 24))
+
+    # сколько секунд отдается посчитанная сводка presenceDashboard (пока не записаны новые маркеры)
+    PRESENCE_DASHBOARD_TTL = float(os.environ.get('PRESENCE_DASHBOARD_TTL', 2))
+
+    # табель exportTimesheet: CSV отдается потоком без ограничения периода, книга XLSX собирается целиком
+    # до отправки первого байта, поэтому ее период ограничен TIMESHEET_XLSX_MAX_DAYS днями
+    TIMESHEET_XLSX_MAX_DAYS = int(os.environ.get('TIMESHEET_XLSX_MAX_DAYS', 93))
+
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 100))
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+
+
+def engine_options(config, url=None):
+    """
+    Параметры create_engine для SQLALCHEMY_ENGINE_OPTIONS (или для базы организации url)
+    """
+    if (url or config['SQLALCHEMY_DATABASE_URI']).startswith('sqlite'):
+        # timeout модуля sqlite3 выставляет busy_timeout соединения
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True
+    }
@@ -0,0 +1,177 @@
+import time
+import threading
+from collections import deque
+from .tenants import TenantLocal
+
+
+EVENTS_BACKLOG = 1000
+EVENTS_CHECK_INTERVAL = 1.0
+EVENTS_MAX_LISTENERS = 4
+
+# сколько секунд ждать пропущенный id журнала: на серверных СУБД транзакция с меньшим id
+# может закоммититься позже, а откаченная транзакция оставляет дыру навсегда
+EVENTS_GAP_WAIT = 5.0
+
+
+def payload(row):
+    """
+    Событие ленты для клиента по строке журнала marker_event
+    """
+    return {
+        'event': row.event,
+        'marker_id': row.marker_id,
+        'staff_id': row.staff_id,
+        'time_in': f'{row.time_in:%Y-%m-%d %H:%M}' if row.time_in else None,
+        'time_out': f'{row.time_out:%Y-%m-%d %H:%M}' if row.time_out else None
+    }
+
+
+class EventBroker:
+    """
+    Лента изменений маркеров для админ-панели (SSE и long-poll).
+
+    События берутся из журнала marker_event, который пишется в одной транзакции с маркерами
+    любым процессом (воркеры gunicorn, flask ingest-wifi, планировщик), поэтому курсор клиента -
+    id последнего полученного события - одинаков во всех воркерах. Процесс держит последние
+    backlog событий в кольцевом буфере и дочитывает журнал не чаще раза в check_interval секунд:
+    запрос делает один из ждущих потоков, остальные ждут его результат. Запись маркеров
+    в этом процессе будит ждущих сразу (notify).
+    Клиенту, отставшему больше чем на backlog событий, или с курсором из другой базы
+    отдается reset - сигнал перечитать todayMarkers целиком.
+    """
+
+    def __init__(self, backlog=EVENTS_BACKLOG, check_interval=EVENTS_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._events = deque(maxlen=backlog)
+        self._last_id = None
+        self._checked_at = 0.0
+        self._polling = False
+        self._gap = None
+        self._condition = threading.Condition()
+
+    @property
+    def cursor(self):
+        return str(self._last_id or 0)
+
+    def notify(self):
+        """
+        В журнал записаны события: следующий wait дочитает его без ожидания check_interval
+        """
+        with self._condition:
+            self._checked_at = 0.0
+            self._condition.notify_all()
+
+    def _poll(self, force=False):
+        """
+        Дочитать журнал, если пора (или force) и его не читает другой поток
+        """
+        from .models import MarkerEvent
+
+        with self._condition:
+            if self._polling or (not force and time.monotonic() - self._checked_at < self.check_interval):
+                return
+            self._polling = True
+            last_id = self._last_id
+
+        rows = None
+        try:
+            if last_id is None:
+                rows = MarkerEvent.latest(self._events.maxlen)
+            else:
+                rows = MarkerEvent.since(last_id, self._events.maxlen)
+        finally:
+            with self._condition:
+                if rows is not None:
+                    self._append(rows, initial=last_id is None)
+                    # прочитана полная порция - дальше, возможно, есть еще
+                    self._checked_at = 0.0 if len(rows) == self._events.maxlen else time.monotonic()
+                self._polling = False
+                self._condition.notify_all()
+
+    def _append(self, rows, initial):
+        if initial:
+            self._events.extend((row.id, payload(row)) for row in rows)
+            self._last_id = rows[-1].id if rows else 0
+            return
+
+        for row in rows:
+            expected = self._last_id + 1
+            if row.id != expected:
+                now = time.monotonic()
+                if self._gap is None or self._gap[0] != expected:
+                    self._gap = (expected, now)
+                if now - self._gap[1] < EVENTS_GAP_WAIT:
+                    break
+            self._gap = None
+            self._events.append((row.id, payload(row)))
+            self._last_id = row.id
+
+    def _parse(self, cursor):
+        """
+        Вернуть id последнего полученного клиентом события или None, если курсор непригоден
+        """
+        if not cursor:
+            return self._last_id
+        if not cursor.isdigit():
+            return None
+        return int(cursor)
+
+    def _since(self, seq):
+        if seq is None or seq > self._last_id or (self._events and seq < self._events[0][0] - 1):
+            return [], True
+        return [(number, data) for number, data in self._events if number > seq], False
+
+    def wait(self, cursor=None, timeout=None):
+        """
+        Дождаться событий после курсора (не дольше timeout секунд).
+        Возвращает (события [(id, payload)], новый курсор, reset)
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        self._poll(force=self._last_id is None)
+        # курсор мог прийти от воркера, который прочитал журнал позже этого
+        if cursor and cursor.isdigit() and int(cursor) > (self._last_id or 0):
+            self._poll(force=True)
+
+        while True:
+            with self._condition:
+                seq = self._parse(cursor)
+                remaining = deadline - time.monotonic()
+                ahead = seq is not None and seq > self._last_id
+                if seq is None or seq < self._last_id or (ahead and not self._polling) or remaining <= 0:
+                    events, reset = self._since(seq)
+                    return events, self.cursor, reset
+                self._condition.wait(min(self.check_interval, remaining))
+            self._poll()
+
+
+class ListenerSlots:
+    """
+    Сколько потоков воркера могут одновременно ждать событий (markerStream, markerEvents).
+
+    Каждое соединение SSE держит поток gthread-воркера все время, пока открыто, long-poll - до timeout.
+    Остальные потоки (WEB_THREADS - limit) остаются для markerIn/markerOut и прочих запросов
+    """
+
+    def __init__(self, limit=EVENTS_MAX_LISTENERS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def init_app(self, app):
+        self.limit = app.config['EVENTS_MAX_LISTENERS']
+
+    def acquire(self):
+        with self._lock:
+            if self._active >= self.limit:
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+
+# у каждой организации своя лента событий
+broker = TenantLocal(EventBroker)
+listeners = ListenerSlots()
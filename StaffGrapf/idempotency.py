@@ -0,0 +1,75 @@
+import datetime
+from .cache import TTLCache
+from .tenants import tenants
+
+
+IN_PROGRESS = ('request in progress', 409)
+KEY_REUSED = ('idempotency key reused', 422)
+REPLAYED = ('ok', 200)
+
+# сколько секунд ключ считается занятым запросом, который еще пишет маркер
+PENDING_TTL = 30.0
+
+
+class IdempotencyStore:
+    """
+    Ключи идемпотентности markerIn/markerOut (заголовок Idempotency-Key).
+
+    Ключ принадлежит сотруднику (организации) и записывается в таблицу idempotency_key в той же транзакции,
+    что и маркер, только при статусе 'ok': повтор запроса с тем же ключом получает 'ok',
+    а не 'still here' / 'did not come yet'. Остальные статусы ничего не пишут, повтор просто
+    посчитает их заново.
+
+    Перед записью ключ проверяется в ограниченном TTL-кэше процесса, а при промахе - одним
+    запросом по первичному ключу, без транзакции записи. Пока запрос с ключом выполняется,
+    повтор в этом процессе получает 409; гонку между процессами разрешают ограничения базы
+    (см. Marker.marker_in)
+    """
+
+    def __init__(self):
+        self.ttl = datetime.timedelta(hours=24)
+        self._seen = TTLCache()
+
+    def init_app(self, app):
+        self.ttl = datetime.timedelta(hours=app.config['IDEMPOTENCY_KEY_HOURS'])
+        self._seen = TTLCache(app.config['IDEMPOTENCY_CACHE_SIZE'], self.ttl.total_seconds())
+
+    def expires(self):
+        return datetime.datetime.now().replace(microsecond=0) + self.ttl
+
+    def begin(self, staff_id, action, key):
+        """
+        None - запрос нужно выполнить; иначе (статус, код) ответа без записи
+        """
+        from .models import IdempotencyKey
+
+        cache_key = (tenants.current(), staff_id, key)
+        if self._seen.add(cache_key, (action, None), ttl=PENDING_TTL):
+            recorded = IdempotencyKey.lookup(staff_id=staff_id, key=key)
+            if recorded is None:
+                return None
+            self._seen.set(cache_key, (recorded, 'ok'))
+            return REPLAYED if recorded == action else KEY_REUSED
+
+        recorded, status = self._seen.get(cache_key, (None, None))
+        if recorded is None:
+            return None
+        if status is None:
+            return IN_PROGRESS
+        return REPLAYED if recorded == action else KEY_REUSED
+
+    def finish(self, staff_id, action, key, status):
+        """
+        Запомнить результат: 'ok' - ключ использован, иначе ключ освобождается
+        """
+        cache_key = (tenants.current(), staff_id, key)
+        if status == 'ok':
+            self._seen.set(cache_key, (action, 'ok'))
+        else:
+            self._seen.pop(cache_key)
+
+    def clear(self):
+        self._seen.clear()
+
+
+idempotency = IdempotencyStore()
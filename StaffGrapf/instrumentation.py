@@ -0,0 +1,164 @@
+import re
+import hmac
+import time
+import heapq
+import hashlib
+import threading
+from functools import lru_cache
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .tenants import tenants
+
+
+# семейства метрик по эндпоинтам: имя, тип, описание, ключ счетчика, формат значения
+METRIC_FAMILIES = (
+    ('staffgraph_requests_total', 'counter', 'Requests handled, by endpoint.', 'requests', '{}'),
+    ('staffgraph_db_queries_total', 'counter', 'SQL statements executed, by endpoint.', 'queries', '{}'),
+    ('staffgraph_db_seconds_total', 'counter', 'Time spent in SQL statements, by endpoint.', 'seconds', '{:.6f}'),
+    ('staffgraph_db_queries_max', 'gauge', 'Most SQL statements in a single request, by endpoint.',
+     'max_queries', '{}'),
+)
+SLOWEST_METRIC = 'staffgraph_db_slowest_statement_seconds'
+
+PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+|:\w+|'(?:[^']|'')*'|\b\d+\b")
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(statement):
+    """
+    Метка запроса для /metrics вместо его текста: команда, первая таблица и отпечаток
+    нормализованного запроса (параметры и литералы заменены на ?, списки IN свернуты)
+    """
+    normalized = PLACEHOLDER_LIST.sub('(?)', PLACEHOLDER.sub('?', ' '.join(statement.split())))
+    table = STATEMENT_TABLE.search(normalized)
+    verb = normalized.split(' ', 1)[0].upper()
+    fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+    return f'{verb} {table.group(1) if table else "-"} {fingerprint}'
+
+
+class SQLMetrics:
+    """
+    Учет SQL-запросов по эндпоинтам (включается настройкой SQL_METRICS).
+
+    Слушатели событий SQLAlchemy вешаются только при включенной настройке,
+    поэтому в выключенном состоянии накладных расходов нет.
+    Каждый ответ получает заголовки X-DB-Query-Count и X-DB-Time-Ms
+    (для потоковых ответов - запросы до начала отдачи тела), а полные данные
+    по эндпоинтам и организациям отдаются в формате Prometheus на /metrics.
+    /metrics открыт только с заголовком Authorization: Bearer <METRICS_TOKEN>, без токена
+    в настройках его нет (404); самые медленные запросы отдаются метками statement_label, без текста SQL.
+    Счетчики живут в памяти процесса: у каждого воркера gunicorn свои.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listening = False
+        self.slowest = 5
+        self.token = None
+        self.endpoints = {}
+
+    def init_app(self, app):
+        if not app.config['SQL_METRICS']:
+            return
+
+        self.slowest = app.config['SQL_METRICS_SLOWEST']
+        self.token = app.config['METRICS_TOKEN']
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        if not has_request_context() or 'sql_queries' not in g:
+            return
+
+        g.sql_queries += 1
+        g.sql_time += elapsed
+        if len(g.sql_slowest) < self.slowest:
+            heapq.heappush(g.sql_slowest, (elapsed, statement))
+        elif elapsed > g.sql_slowest[0][0]:
+            heapq.heapreplace(g.sql_slowest, (elapsed, statement))
+
+    @staticmethod
+    def _before_request():
+        g.sql_queries = 0
+        g.sql_time = 0.0
+        g.sql_slowest = []
+
+    def _after_request(self, response):
+        if 'sql_queries' not in g:
+            return response
+
+        response.headers['X-DB-Query-Count'] = str(g.sql_queries)
+        response.headers['X-DB-Time-Ms'] = f'{g.sql_time * 1000:.3f}'
+
+        # итог записывается при закрытии ответа, чтобы учесть запросы потоковых ответов
+        if request.endpoint not in (None, 'metrics'):
+            key, state = (tenants.current(), request.endpoint), g._get_current_object()
+            response.call_on_close(lambda: self._record(key, state))
+        return response
+
+    def _record(self, key, state):
+        with self._lock:
+            stats = self.endpoints.setdefault(key, {
+                'requests': 0, 'queries': 0, 'seconds': 0.0, 'max_queries': 0, 'slowest': []})
+            stats['requests'] += 1
+            stats['queries'] += state.sql_queries
+            stats['seconds'] += state.sql_time
+            stats['max_queries'] = max(stats['max_queries'], state.sql_queries)
+            stats['slowest'] = heapq.nlargest(self.slowest, stats['slowest'] + state.sql_slowest)
+
+    def render(self):
+        """
+        Метрики в текстовом формате Prometheus: у каждого семейства строки HELP и TYPE,
+        за ними все его отсчеты по эндпоинтам
+        """
+        with self._lock:
+            items = sorted(self.endpoints.items(), key=lambda item: (item[0][0] or '', item[0][1]))
+            endpoints = [(labels(*key), dict(stats)) for key, stats in items]
+
+        lines = []
+        for name, kind, description, key, template in METRIC_FAMILIES:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for label, stats in endpoints:
+                lines.append(f'{name}{{{label}}} {template.format(stats[key])}')
+
+        lines.append(f'# HELP {SLOWEST_METRIC} Slowest SQL statements seen, by endpoint.')
+        lines.append(f'# TYPE {SLOWEST_METRIC} gauge')
+        for label, stats in endpoints:
+            # один и тот же запрос мог попасть в список несколько раз - отсчет по метке один
+            slowest = {}
+            for elapsed, statement in stats['slowest']:
+                statement = statement_label(statement)
+                slowest[statement] = max(elapsed, slowest.get(statement, 0.0))
+            for statement, elapsed in sorted(slowest.items(), key=lambda item: -item[1]):
+                lines.append(f'{SLOWEST_METRIC}{{{label},statement="{statement}"}} {elapsed:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        if not self.token:
+            return Response(status=404)
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f'Bearer {self.token}'.encode()):
+            return Response(status=401, headers={'WWW-Authenticate': 'Bearer'})
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def labels(tenant, endpoint):
+    return f'endpoint="{endpoint}"' if tenant is None else f'tenant="{tenant}",endpoint="{endpoint}"'
+
+
+metrics = SQLMetrics()
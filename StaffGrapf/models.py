@@ -1,7 +1,96 @@
+import re
+import bisect
+import secrets
 import datetime
 import sqlalchemy.exc
-from sqlalchemy import func
-from . import db
+from sqlalchemy import or_, event, tuple_, DDL, text, table, column, update, bindparam
+from . import db, projections
+from .additional_functions import normalize_mac
+from .presence import presence
+from .events import broker
+from .cache import cache
+from .auth import auth, token_hash
+from .idempotency import idempotency
+
+
+STREAM_CHUNK_SIZE = 500
+AUTO_CLOSE_REASON = 'auto closed'
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+STAFF_EDITABLE = frozenset(('appointment', 'firstname', 'lastname', 'middle_name', 'gender', 'phone', 'email',
+                            'at_work', 'from_work', 'active', 'admin', 'department_id'))
+
+STAFF_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS staff_search USING fts5(
+        firstname, lastname, middle_name, phone,
+        content='staff', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_ai AFTER INSERT ON staff BEGIN
+        INSERT INTO staff_search(rowid, firstname, lastname, middle_name, phone)
+        VALUES (new.id, new.firstname, new.lastname, new.middle_name, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_ad AFTER DELETE ON staff BEGIN
+        INSERT INTO staff_search(staff_search, rowid, firstname, lastname, middle_name, phone)
+        VALUES ('delete', old.id, old.firstname, old.lastname, old.middle_name, old.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_au AFTER UPDATE OF firstname, lastname, middle_name, phone ON staff
+    BEGIN
+        INSERT INTO staff_search(staff_search, rowid, firstname, lastname, middle_name, phone)
+        VALUES ('delete', old.id, old.firstname, old.lastname, old.middle_name, old.phone);
+        INSERT INTO staff_search(rowid, firstname, lastname, middle_name, phone)
+        VALUES (new.id, new.firstname, new.lastname, new.middle_name, new.phone);
+    END""",
+)
+# на PostgreSQL поиск по префиксам (ILIKE) идет по триграммным GIN-индексам pg_trgm
+STAFF_TRIGRAM_DDL = ('CREATE EXTENSION IF NOT EXISTS pg_trgm',) + tuple(
+    f'CREATE INDEX IF NOT EXISTS ix_staff_{name}_trgm ON staff USING gin ({name} gin_trgm_ops)'
+    for name in ('firstname', 'lastname', 'middle_name', 'phone')
+)
+STAFF_SEARCH = table('staff_search', column('rowid'), column('rank'), column('staff_search'))
+
+
+def markers_committed(markers):
+    """
+    Вызывается после commit маркеров со снимками записанных строк
+    """
+    cache.bump('marker')
+    presence.record(markers)
+    broker.notify()
+
+
+def work_time(value):
+    """
+    Время прихода/ухода по графику: datetime.time или строка '07:00', иначе None
+    """
+    if isinstance(value, datetime.time) or value is None:
+        return value
+    try:
+        hours, minutes = value.split(':')
+        return datetime.time(int(hours), int(minutes))
+    except (AttributeError, TypeError, ValueError) as error:
+        print(error)
+        return None
+
+
+def shift_end(time_in, from_work, max_shift):
+    """
+    Плановый конец смены: ближайшее после time_in время ухода from_work,
+    но не позже time_in + max_shift
+    """
+    end = time_in + max_shift
+    if from_work is not None:
+        planned = datetime.datetime.combine(time_in.date(), from_work)
+        if planned <= time_in:
+            planned += datetime.timedelta(days=1)
+        end = min(end, planned)
+    return end
+
+
+def marker_days(markers):
+    """
+    Пары (staff_id, день) для сводки marker_day, которые затрагивают маркеры
+    """
+    return {(marker['staff_id'], marker['time_in'].date()) for marker in markers if marker['time_in']}
 
 
 class Marker(db.Model):
@@ -13,6 +102,14 @@ class Marker(db.Model):
     reason_out = db.Column(db.Text)
     staff_id = db.Column(db.Integer(), db.ForeignKey('staff.id'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_marker_staff_id_time_out', staff_id, time_out),
+        db.Index('ix_marker_time_in', time_in),
+        # не больше одного открытого маркера на сотрудника
+        db.Index('ix_marker_open', staff_id, unique=True,
+                 sqlite_where=time_out.is_(None), postgresql_where=time_out.is_(None)),
+    )
+
     def __init__(self, staff_id=None, reason_in=None, time_in=None, time_out=None, reason_out=None):
         self.time_in = time_in
         self.reason_in = reason_in
@@ -20,36 +117,58 @@ class Marker(db.Model):
         self.reason_out = reason_out
         self.staff_id = staff_id
 
+    def snapshot(self):
+        return {
+            'id': self.id,
+            'staff_id': self.staff_id,
+            'time_in': self.time_in,
+            'time_out': self.time_out,
+            'reason_in': self.reason_in,
+            'reason_out': self.reason_out
+        }
+
     @classmethod
-    def marker_in(cls, staff_id=None, reason_in=None):
+    def marker_in(cls, staff_id=None, reason_in=None, idempotency_key=None):
         """
-        Метод создания маркера входа
+        Метод создания маркера входа.
+        Второй открытый маркер не дает создать уникальный индекс ix_marker_open;
+        idempotency_key записывается вместе с маркером (см. idempotency.py)
         """
 
         marker = cls.query.filter(cls.staff_id == staff_id, cls.time_out == None).first()
 
         if marker:
-            return 'still here'
+            db.session.remove()
+            return IdempotencyKey.replay(staff_id, idempotency_key, 'in', 'still here')
 
         marker = cls(staff_id, reason_in, time_in=datetime.datetime.now().replace(microsecond=0).replace(second=0))
 
         try:
             db.session.add(marker)
+            db.session.flush()
+            snapshot = marker.snapshot()
+            if idempotency_key:
+                db.session.add(IdempotencyKey(staff_id=staff_id, key=idempotency_key, action='in',
+                                              marker_id=marker.id, expires=idempotency.expires()))
+            MarkerDay.refresh(marker_days([snapshot]))
+            MarkerEvent.record([snapshot])
             db.session.commit()
             db.session.remove()
+            markers_committed([snapshot])
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
             db.session.remove()
 
-            if 'UNIQUE' in str(error):
-                return 'not unique'
+            # параллельный запрос успел открыть маркер (или записать тот же ключ)
+            if 'UNIQUE' in str(error).upper():
+                return IdempotencyKey.replay(staff_id, idempotency_key, 'in', 'still here')
             if 'NOT NULL' in str(error):
                 return None
             return f'{error}'
 
     @classmethod
-    def marker_out(cls, staff_id=None, reason_out=None):
+    def marker_out(cls, staff_id=None, reason_out=None, idempotency_key=None):
         """
         Метод создания маркера выхода
         """
@@ -60,25 +179,127 @@ class Marker(db.Model):
         marker = cls.query.filter(cls.staff_id == staff_id, cls.time_out == None).first()
 
         if not marker:
-            return 'did not come yet'
+            db.session.remove()
+            return IdempotencyKey.replay(staff_id, idempotency_key, 'out', 'did not come yet')
 
         marker.time_out = datetime.datetime.now().replace(microsecond=0).replace(second=0)
         marker.reason_out = reason_out
+        snapshot = marker.snapshot()
 
         try:
+            if idempotency_key:
+                db.session.add(IdempotencyKey(staff_id=staff_id, key=idempotency_key, action='out',
+                                              marker_id=marker.id, expires=idempotency.expires()))
+            MarkerDay.refresh(marker_days([snapshot]))
+            MarkerEvent.record([snapshot])
             db.session.commit()
             db.session.remove()
+            markers_committed([snapshot])
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
             db.session.remove()
 
-            if 'UNIQUE' in str(error):
-                return 'not unique'
+            if 'UNIQUE' in str(error).upper():
+                return IdempotencyKey.replay(staff_id, idempotency_key, 'out', 'did not come yet')
             if 'NOT NULL' in str(error):
                 return None
             return f'{error}'
 
+    @classmethod
+    def marker_batch(cls, events=None, retry=True):
+        """
+        Метод пакетной записи маркеров входа/выхода.
+
+        events - список словарей {'staff_id': int, 'reason': str | None, 'action': 'in' | 'out'}
+        и необязательным 'idempotency_key'. Открытые маркеры и уже записанные ключи всех сотрудников
+        пакета ищутся одним запросом каждые, новые и закрываемые маркеры пишутся bulk-операциями
+        в одной транзакции. Если параллельная запись открыла маркер мимо пакета (уникальный
+        ix_marker_open), пакет один раз перечитывается и пишется заново.
+        Возвращается список статусов в порядке событий.
+        """
+        if not events:
+            return None
+
+        now = datetime.datetime.now().replace(microsecond=0).replace(second=0)
+        staff_ids = {event['staff_id'] for event in events if event['staff_id']}
+
+        # staff_id -> открытый маркер из базы (есть 'id') или маркер, созданный в этом пакете
+        open_markers = {
+            row.staff_id: row._asdict() for row in
+            db.session.query(cls.id, cls.staff_id, cls.time_in, cls.time_out, cls.reason_in, cls.reason_out)
+            .filter(cls.staff_id.in_(staff_ids), cls.time_out == None)
+        } if staff_ids else {}
+        recorded = IdempotencyKey.recorded({(event['staff_id'], event['idempotency_key']) for event in events
+                                            if event['staff_id'] and event.get('idempotency_key')})
+
+        inserts = []
+        updates = []
+        closed = []
+        keys = []
+        statuses = []
+        for event in events:
+            staff_id = event['staff_id']
+            if not staff_id:
+                statuses.append('access denied')
+                continue
+
+            key = event.get('idempotency_key')
+            if key and (staff_id, key) in recorded:
+                statuses.append('ok' if recorded[staff_id, key] == event['action'] else 'idempotency key reused')
+                continue
+
+            marker = open_markers.get(staff_id)
+            if event['action'] == 'in':
+                if marker is not None:
+                    statuses.append('still here')
+                    continue
+                marker = {'staff_id': staff_id, 'time_in': now, 'time_out': None,
+                          'reason_in': event['reason'], 'reason_out': None}
+                inserts.append(marker)
+                open_markers[staff_id] = marker
+            else:
+                if marker is None:
+                    statuses.append('did not come yet')
+                    continue
+                marker['time_out'] = now
+                marker['reason_out'] = event['reason']
+                if 'id' in marker:
+                    updates.append({'id': marker['id'], 'time_out': now, 'reason_out': event['reason']})
+                    closed.append(marker)
+                del open_markers[staff_id]
+            if key:
+                recorded[staff_id, key] = event['action']
+                keys.append(({'staff_id': staff_id, 'key': key, 'action': event['action']}, marker))
+            statuses.append('ok')
+
+        if not inserts and not updates:
+            db.session.remove()
+            return statuses
+
+        try:
+            # сначала закрыть: уход и новый приход одного сотрудника в пакете не нарушают ix_marker_open
+            if updates:
+                db.session.bulk_update_mappings(cls, updates)
+            if inserts:
+                db.session.bulk_insert_mappings(cls, inserts, return_defaults=True)
+            if keys:
+                expires = idempotency.expires()
+                db.session.bulk_insert_mappings(IdempotencyKey, [
+                    {**row, 'marker_id': marker.get('id'), 'expires': expires} for row, marker in keys])
+            MarkerDay.refresh(marker_days(inserts + closed))
+            MarkerEvent.record(inserts + closed)
+            db.session.commit()
+            db.session.remove()
+            markers_committed(inserts + closed)
+            return statuses
+        except sqlalchemy.exc.IntegrityError as error:
+            db.session.rollback()
+            db.session.remove()
+            if retry and 'UNIQUE' in str(error).upper():
+                return cls.marker_batch(events=events, retry=False)
+            return [f'{error}' if status == 'ok' else status for status in statuses]
+
     @classmethod
     def edit_marker(cls, reason_in=None, reason_out=None, time_in=None, time_out=None, marker_id=None):
         """
@@ -89,6 +310,8 @@ class Marker(db.Model):
         if not marker:
             return None
 
+        previous = marker.snapshot()
+
         if time_in:
             try:
                 datetime_time_in = datetime.datetime.strptime(f'{time_in}', '%Y-%m-%d %H:%M')
@@ -107,10 +330,14 @@ class Marker(db.Model):
 
         marker.reason_in = reason_in
         marker.reason_out = reason_out
+        snapshot = marker.snapshot()
 
         try:
+            MarkerDay.refresh(marker_days([previous, snapshot]))
+            MarkerEvent.record([snapshot], edited=True)
             db.session.commit()
             db.session.remove()
+            markers_committed([snapshot])
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
@@ -147,45 +374,253 @@ class Marker(db.Model):
 
         try:
             db.session.add(marker)
+            db.session.flush()
+            snapshot = marker.snapshot()
+            MarkerDay.refresh(marker_days([snapshot]))
+            MarkerEvent.record([snapshot], edited=True)
             db.session.commit()
             db.session.remove()
+            markers_committed([snapshot])
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
             db.session.remove()
 
-            if 'UNIQUE' in str(error):
-                return 'not unique'
+            if 'UNIQUE' in str(error).upper():
+                return 'still here'
             if 'NOT NULL' in str(error):
                 return None
             return f'{error}'
 
     @classmethod
-    def today_markers(cls):
+    def close_stale(cls, now=None, grace=datetime.timedelta(hours=2), max_shift=datetime.timedelta(hours=16),
+                    chunk_size=500):
         """
-        Метод отдает сегодняшние маркеры
+        Метод закрывает забытые открытые маркеры: прошло grace после планового конца смены
+        (Staff.from_work или time_in + max_shift, см. shift_end). time_out ставится
+        на плановый конец смены, reason_out - AUTO_CLOSE_REASON.
+
+        Открытые маркеры перебираются по id порциями по chunk_size, каждая порция
+        закрывается одним UPDATE в своей короткой транзакции (маркер, закрытый за это время
+        самим сотрудником, не трогается). Генератор, отдает число закрытых маркеров по каждой порции
         """
-        markers = cls.query.filter(func.DATE(cls.time_in) == datetime.date.today()).all()
+        now = now or datetime.datetime.now()
+        table = cls.__table__
+        statement = update(table).where(table.c.id == bindparam('marker_id'), table.c.time_out == None) \
+            .values(time_out=bindparam('end'), reason_out=AUTO_CLOSE_REASON)
+
+        last_id = 0
+        while True:
+            rows = db.session.query(cls.id, cls.time_in, Staff.from_work).join(Staff, Staff.id == cls.staff_id) \
+                .filter(cls.time_out == None, cls.time_in <= now - grace, cls.id > last_id) \
+                .order_by(cls.id).limit(chunk_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            stale = []
+            for marker_id, time_in, from_work in rows:
+                end = shift_end(time_in, from_work, max_shift)
+                if end + grace <= now:
+                    stale.append({'marker_id': marker_id, 'end': end})
+            if not stale:
+                continue
 
-        if not markers:
-            return None
+            db.session.execute(statement, stale)
+            closed = [marker for marker in projections.MARKER.dicts(projections.MARKER.select(
+                projections.MARKER.c.id.in_([item['marker_id'] for item in stale])))
+                if marker['reason_out'] == AUTO_CLOSE_REASON]
+            MarkerDay.refresh(marker_days(closed))
+            MarkerEvent.record(closed)
+            db.session.commit()
+            markers_committed(closed)
+            yield len(closed)
 
-        data_markers = []
-        for marker in markers:
-            data_markers.append({
-                'time_in': marker.time_in,
-                'time_out': marker.time_out,
-                'reason_in': marker.reason_in,
-                'reason_out': marker.reason_out,
-                'staff_id': marker.staff_id
-            })
+        db.session.remove()
+
+    @classmethod
+    def today_markers(cls, cursor=0, limit=100):
+        """
+        Метод отдает страницу сегодняшних маркеров (из кэша присутствия presence):
+        до limit + 1 маркеров с id > cursor
+        """
+        markers = presence.today_markers()
+        start = bisect.bisect_right(markers, cursor, key=lambda marker: marker['id'])
 
-        return data_markers
+        # словари кэша присутствия уже в виде projections.MARKER и не меняются после записи
+        return markers[start:start + limit + 1]
 
     def __repr__(self):
         return f'<Marker {self.staff_id!r} {self.time_in!r} - {self.time_out!r}>'
 
 
+class MarkerDay(db.Model):
+    """
+    Посуточная сводка маркеров сотрудника. Пересчитывается в той же транзакции,
+    что и запись маркеров, поэтому отчеты могут не читать таблицу marker
+    """
+    __tablename__ = 'marker_day'
+    staff_id = db.Column(db.Integer(), db.ForeignKey('staff.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    first_in = db.Column(db.DateTime)
+    last_out = db.Column(db.DateTime)
+    minutes = db.Column(db.Integer, nullable=False)
+    open_count = db.Column(db.Integer, nullable=False)
+    late = db.Column(db.Boolean, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_marker_day_day', day),
+    )
+
+    @classmethod
+    def rows_from_markers(cls, date_from, date_to, staff_ids=None):
+        """
+        Посчитать строки сводки по таблице marker за период
+        """
+        from .reports import daily_rows
+
+        rows = list(daily_rows(date_from, date_to, staff_ids))
+        at_work = dict(db.session.query(Staff.id, Staff.at_work)
+                       .filter(Staff.id.in_({row[0] for row in rows})))
+
+        return [{
+            'staff_id': staff_id,
+            'day': day,
+            'first_in': first_in,
+            'last_out': last_out,
+            'minutes': round(minutes or 0),
+            'open_count': open_count or 0,
+            'late': bool(first_in and at_work.get(staff_id) and first_in.time() > at_work[staff_id])
+        } for staff_id, day, first_in, last_out, minutes, open_count in rows]
+
+    @classmethod
+    def refresh(cls, days):
+        """
+        Пересчитать сводку для пар (staff_id, день) в текущей транзакции (без commit)
+        """
+        if not days:
+            return
+
+        db.session.flush()
+        rows = [row for row in cls.rows_from_markers(min(day for _, day in days), max(day for _, day in days),
+                                                     {staff_id for staff_id, _ in days})
+                if (row['staff_id'], row['day']) in days]
+
+        db.session.query(cls).filter(tuple_(cls.staff_id, cls.day).in_(list(days))) \
+            .delete(synchronize_session=False)
+        if rows:
+            db.session.bulk_insert_mappings(cls, rows)
+
+    @classmethod
+    def rebuild(cls, date_from, date_to, chunk_days=31):
+        """
+        Пересобрать сводку за период по таблице marker, по chunk_days дней в транзакции.
+        Генератор, отдает (начало, конец, число строк) по каждой порции
+        """
+        chunk_from = date_from
+        while chunk_from <= date_to:
+            chunk_to = min(chunk_from + datetime.timedelta(days=chunk_days - 1), date_to)
+            rows = cls.rows_from_markers(chunk_from, chunk_to)
+            db.session.query(cls).filter(cls.day >= chunk_from, cls.day <= chunk_to) \
+                .delete(synchronize_session=False)
+            db.session.bulk_insert_mappings(cls, rows)
+            db.session.commit()
+            yield chunk_from, chunk_to, len(rows)
+            chunk_from = chunk_to + datetime.timedelta(days=1)
+        db.session.remove()
+
+    def __repr__(self):
+        return f'<MarkerDay {self.staff_id!r} {self.day!r} {self.minutes!r}>'
+
+
+class MarkerArchive(db.Model):
+    """
+    Заархивированные месяцы маркеров (см. archive.py)
+    """
+    __tablename__ = 'marker_archive'
+    month = db.Column(db.Date, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<MarkerArchive {self.month!r} {self.rows!r}>'
+
+
+class MarkerEvent(db.Model):
+    """
+    Журнал изменений маркеров: пишется в той же транзакции, что и маркеры, любым процессом.
+    Из него наполняются лента событий (events.py) и кэш присутствия (presence.py) всех воркеров
+    """
+    __tablename__ = 'marker_event'
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(4), nullable=False)  # in | out | edit
+    marker_id = db.Column(db.Integer, nullable=False)
+    staff_id = db.Column(db.Integer, nullable=False)
+    time_in = db.Column(db.DateTime)
+    time_out = db.Column(db.DateTime)
+    created = db.Column(db.DateTime, nullable=False, index=True)
+
+    # id не переиспользуются после удаления старых событий: это курсор клиентов ленты
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    @classmethod
+    def record(cls, markers, edited=False):
+        """
+        Записать события по снимкам маркеров (до commit, в транзакции маркеров)
+        """
+        if not markers:
+            return
+        now = datetime.datetime.now().replace(microsecond=0)
+        db.session.execute(cls.__table__.insert(), [{
+            'event': 'edit' if edited else ('in' if marker['time_out'] is None else 'out'),
+            'marker_id': marker['id'],
+            'staff_id': marker['staff_id'],
+            'time_in': marker['time_in'],
+            'time_out': marker['time_out'],
+            'created': now
+        } for marker in markers])
+
+    @classmethod
+    def since(cls, last_id, limit):
+        """
+        Метод отдает до limit событий с id > last_id
+        """
+        rows = db.session.query(cls.id, cls.event, cls.marker_id, cls.staff_id, cls.time_in, cls.time_out) \
+            .filter(cls.id > last_id).order_by(cls.id).limit(limit).all()
+        db.session.remove()
+        return rows
+
+    @classmethod
+    def latest(cls, limit):
+        """
+        Метод отдает последние limit событий по возрастанию id
+        """
+        rows = db.session.query(cls.id, cls.event, cls.marker_id, cls.staff_id, cls.time_in, cls.time_out) \
+            .order_by(cls.id.desc()).limit(limit).all()
+        db.session.remove()
+        return rows[::-1]
+
+    @classmethod
+    def last_id(cls):
+        last_id = db.session.query(db.func.max(cls.id)).scalar()
+        db.session.remove()
+        return last_id or 0
+
+    @classmethod
+    def delete_old(cls, before):
+        """
+        Удалить события старше before; последнее событие остается, чтобы id продолжались с него
+        """
+        last_id = db.session.query(db.func.max(cls.id)).scalar() or 0
+        deleted = cls.query.filter(cls.created < before, cls.id < last_id).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        return deleted
+
+    def __repr__(self):
+        return f'<MarkerEvent {self.id!r} {self.event!r} {self.marker_id!r}>'
+
+
 class Department(db.Model):
     __tablename__ = 'department'
     id = db.Column(db.Integer, primary_key=True)
@@ -205,6 +640,7 @@ class Department(db.Model):
             db.session.add(department)
             db.session.commit()
             db.session.remove()
+            cache.bump('department')
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
@@ -219,15 +655,21 @@ class Department(db.Model):
     @classmethod
     def edit_department(cls, department_id=None, title=None):
         """
-        Метод создания отдела
+        Метод изменения отдела
         """
 
         department = cls.query.filter(cls.id == department_id).first()
+
+        if not department:
+            db.session.remove()
+            return 'did not come'
+
         department.title = title
 
         try:
             db.session.commit()
             db.session.remove()
+            cache.bump('department')
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
@@ -256,7 +698,7 @@ class Staff(db.Model):
     email = db.Column(db.String(50), nullable=True)
     at_work = db.Column(db.Time, nullable=True)
     from_work = db.Column(db.Time, nullable=True)
-    password = db.Column(db.String(16), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     active = db.Column(db.Boolean, nullable=False)
     admin = db.Column(db.Boolean, nullable=False)
     created = db.Column(db.DateTime, nullable=False)
@@ -266,7 +708,7 @@ class Staff(db.Model):
     def __init__(self, photo=None, appointment=None, firstname=None, lastname=None, middle_name=None, gender=None,
                  phone=None, email=None, at_work=None, from_work=None, password=None, active=True, admin=False,
                  department_id=None):
-        self.phone = photo
+        self.photo = photo
         self.appointment = appointment
         self.firstname = firstname
         self.lastname = lastname
@@ -291,26 +733,16 @@ class Staff(db.Model):
         Метод создания персонала
         """
 
-        try:
-            at_work = at_work.split(':')
-            from_work = from_work.split(':')
-
-            at_work_time = datetime.time(int(at_work[0]), int(at_work[1]))
-            from_work_time = datetime.time(int(from_work[0]), int(from_work[1]))
-        except Exception as error:
-            print(error)
-            at_work_time = None
-            from_work_time = None
-
         staff = cls(photo=photo, appointment=appointment, firstname=firstname, lastname=lastname,
-                    middle_name=middle_name, phone=phone, email=email, gender=gender, at_work=at_work_time,
-                    from_work=from_work_time, password=password, active=active, admin=admin,
-                    department_id=department_id)
+                    middle_name=middle_name, phone=phone, email=email, gender=gender, at_work=work_time(at_work),
+                    from_work=work_time(from_work), password=auth.hash_password(password) if password else None,
+                    active=active, admin=admin, department_id=department_id)
 
         try:
             db.session.add(staff)
             db.session.commit()
             db.session.remove()
+            cache.bump('staff')
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
@@ -337,6 +769,7 @@ class Staff(db.Model):
         try:
             db.session.commit()
             db.session.remove()
+            cache.bump('staff')
             return 'ok'
         except Exception as error:
             db.session.remove()
@@ -344,32 +777,30 @@ class Staff(db.Model):
             return f'{error}'
 
     @classmethod
-    def edit_staff(cls, staff_id=None, photo=None, appointment=None, firstname=None, lastname=None, middle_name=None,
-                   gender=None, phone=None, email=None, at_work=None, from_work=None, password=None, active=True,
-                   admin=False, department_id=None):
+    def edit_staff(cls, staff_id=None, password=None, **fields):
+        """
+        Метод изменения персонала: меняются только переданные столбцы fields (STAFF_EDITABLE),
+        без нового пароля остается прежний. Фото меняет только set_photo (loadPhoto)
+        """
         staff = cls.query.filter(cls.id == staff_id).first()
 
         if not staff:
             return 'did not come'
 
-        staff.photo = photo
-        staff.appointment = appointment
-        staff.firstname = firstname
-        staff.lastname = lastname
-        staff.middle_name = middle_name
-        staff.gender = gender
-        staff.phone = phone
-        staff.email = email
-        staff.at_work = at_work
-        staff.from_work = from_work
-        staff.password = password
-        staff.active = active
-        staff.admin = admin
-        staff.department_id = department_id
+        for name in ('at_work', 'from_work'):
+            if name in fields:
+                fields[name] = work_time(fields[name])
+        for name, value in fields.items():
+            if name not in STAFF_EDITABLE:
+                raise TypeError(name)
+            setattr(staff, name, value)
+        if password:
+            staff.password = auth.hash_password(password)
 
         try:
             db.session.commit()
             db.session.remove()
+            cache.bump('staff')
             return 'ok'
         except sqlalchemy.exc.IntegrityError as error:
             db.session.rollback()
@@ -382,77 +813,279 @@ class Staff(db.Model):
             return f'{error}'
 
     @classmethod
-    def get_staff(cls, staff_id=None):
-        staff = cls.query.filter(cls.id == staff_id).first()
+    def login(cls, phone=None, password=None):
+        """
+        Метод входа по телефону и паролю: выдает токен сессии.
+        Пароль, сохраненный открытым текстом или устаревшим методом, перехэшируется
+        """
+        staff = cls.query.filter(cls.phone == phone, cls.active == True).first()
 
         if not staff:
+            db.session.remove()
+            auth.burn(password)
             return None
 
-        return {
-            'photo': staff.photo,
-            'appointment': staff.appointment,
-            'firstname': staff.firstname,
-            'lastname': staff.lastname,
-            'middle_name': staff.middle_name,
-            'gender': staff.gender,
-            'phone': staff.phone,
-            'email': staff.email,
-            'active': staff.active,
-            'department_id': staff.department_id
-        }
+        if not auth.check_password(staff.password, password):
+            db.session.remove()
+            return None
+
+        if auth.needs_rehash(staff.password):
+            staff.password = auth.hash_password(password)
+
+        token = secrets.token_urlsafe(32)
+        now = datetime.datetime.now().replace(microsecond=0)
+        db.session.add(SessionToken(token_hash=token_hash(token), staff_id=staff.id, created=now,
+                                    expires=now + auth.token_ttl))
+        admin = staff.admin
+        staff_id = staff.id
+        db.session.commit()
+        db.session.remove()
+        return {'token': token, 'staff_id': staff_id, 'admin': admin}
 
     @classmethod
-    def get_staffs_from_department(cls, department_id=None):
-        staffs = cls.query.filter(cls.department_id == department_id).all()
+    def set_photo(cls, staff_id=None, photo=None):
+        """
+        Метод привязки загруженного фото к сотруднику
+        """
+        updated = cls.query.filter(cls.id == staff_id).update({'photo': photo}, synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        cache.bump('staff')
 
-        if not staffs:
+        if not updated:
             return None
+        return 'ok'
+
+    @classmethod
+    def get_staff(cls, staff_id=None):
+        staff = projections.STAFF
+        row = staff.rows(staff.select(staff.c.id == staff_id)).first()
+
+        if not row:
+            return None
+
+        return staff.dump(row)
+
+    @classmethod
+    def get_staffs_from_department(cls, department_id=None, cursor=0, limit=100):
+        """
+        Метод отдает страницу персонала отдела: до limit + 1 записей с id > cursor.
+        Записи читаются из базы порциями и отдаются генератором
+        """
+        staff = projections.STAFF
+        query = staff.select(staff.c.department_id == department_id, staff.c.id > cursor) \
+            .order_by(staff.c.id).limit(limit + 1)
+
+        return staff.dicts(query, chunk_size=STREAM_CHUNK_SIZE)
+
+    @classmethod
+    def search_staff(cls, query=None, page=1, per_page=SEARCH_PAGE_SIZE):
+        """
+        Метод поиска персонала.
 
-        data_staffs = []
-        for staff in staffs:
-            data_staffs.append({
-                'photo': staff.photo,
-                'appointment': staff.appointment,
-                'firstname': staff.firstname,
-                'lastname': staff.lastname,
-                'middle_name': staff.middle_name,
-                'gender': staff.gender,
-                'phone': staff.phone,
-                'email': staff.email,
-                'active': staff.active,
-                'department_id': staff.department_id
-            })
-
-        return data_staffs
-
-    @classmethod
-    def search_staff(cls, query=None):
+        На SQLite поиск идет по FTS5 индексу staff_search (префиксы слов в ФИО и телефоне)
+        с ранжированием bm25, на остальных СУБД - по префиксам столбцов (на PostgreSQL
+        по триграммным индексам STAFF_TRIGRAM_DDL).
+        Результат отдается постранично.
+        """
         if not query:
             return None
 
-        staffs = cls.query.all()
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return None
+
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), SEARCH_MAX_PAGE_SIZE)
+        offset = (page - 1) * per_page
+
+        staff = projections.STAFF
+        if db.session.get_bind().dialect.name == 'sqlite':
+            match = ' '.join(f'"{term}"*' for term in terms)
+            query = staff.select(STAFF_SEARCH.c.staff_search.op('MATCH')(match)) \
+                .join_from(staff.table, STAFF_SEARCH, STAFF_SEARCH.c.rowid == staff.c.id) \
+                .order_by(STAFF_SEARCH.c.rank)
+        else:
+            conditions = [or_(staff.c.firstname.ilike(f'{term}%'), staff.c.lastname.ilike(f'{term}%'),
+                              staff.c.middle_name.ilike(f'{term}%'), staff.c.phone.ilike(f'%{term}%'))
+                          for term in terms]
+            query = staff.select(*conditions).order_by(staff.c.lastname, staff.c.firstname, staff.c.id)
+
+        staffs = list(staff.dicts(query.limit(per_page).offset(offset)))
         if not staffs:
             return None
 
-        data_staffs = []
-        for staff in staffs:
-            if query.lower() not in f'{staff.firstname} {staff.lastname} {staff.middle_name} {staff.phone}'.lower():
-                continue
+        return staffs
+
+    @classmethod
+    def rebuild_search_index(cls):
+        """
+        Метод создает (если нужно) и перестраивает поисковый индекс staff_search,
+        на PostgreSQL - создает триграммные индексы
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            for statement in STAFF_TRIGRAM_DDL:
+                db.session.execute(text(statement))
+            db.session.commit()
+            db.session.remove()
+            return 'ok'
+        if dialect != 'sqlite':
+            return None
 
-            data_staffs.append({
-                'photo': staff.photo,
-                'appointment': staff.appointment,
-                'firstname': staff.firstname,
-                'lastname': staff.lastname,
-                'middle_name': staff.middle_name,
-                'gender': staff.gender,
-                'phone': staff.phone,
-                'email': staff.email,
-                'active': staff.active,
-                'department_id': staff.department_id
-            })
-
-        return data_staffs
+        for statement in STAFF_SEARCH_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO staff_search(staff_search) VALUES ('rebuild')"))
+        db.session.commit()
+        db.session.remove()
+        return 'ok'
 
     def __repr__(self):
         return f'<Staff {self.firstname!r} {self.lastname!r} {self.middle_name!r}>'
+
+
+class SessionToken(db.Model):
+    """
+    Сессия API: хранится sha256 токена (см. auth.py)
+    """
+    __tablename__ = 'session_token'
+    token_hash = db.Column(db.String(64), primary_key=True)
+    staff_id = db.Column(db.Integer(), db.ForeignKey('staff.id'), nullable=False, index=True)
+    created = db.Column(db.DateTime, nullable=False)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    @classmethod
+    def identity(cls, token_hash=None):
+        """
+        Метод отдает (staff_id, admin, expires) живой сессии активного сотрудника или None
+        """
+        row = db.session.query(cls.staff_id, Staff.admin, cls.expires).join(Staff, Staff.id == cls.staff_id) \
+            .filter(cls.token_hash == token_hash, cls.expires > datetime.datetime.now(), Staff.active == True) \
+            .first()
+        db.session.remove()
+        return row
+
+    @classmethod
+    def logout(cls, token_hash=None):
+        deleted = cls.query.filter(cls.token_hash == token_hash).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        return 'ok' if deleted else None
+
+    @classmethod
+    def delete_expired(cls):
+        deleted = cls.query.filter(cls.expires <= datetime.datetime.now()).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        return deleted
+
+    def __repr__(self):
+        return f'<SessionToken {self.staff_id!r} {self.expires!r}>'
+
+
+class IdempotencyKey(db.Model):
+    """
+    Использованный ключ идемпотентности markerIn/markerOut (см. idempotency.py)
+    """
+    __tablename__ = 'idempotency_key'
+    staff_id = db.Column(db.Integer(), db.ForeignKey('staff.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    action = db.Column(db.String(3), nullable=False)
+    marker_id = db.Column(db.Integer)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    @classmethod
+    def lookup(cls, staff_id=None, key=None):
+        """
+        Метод отдает действие ('in' | 'out'), записанное с ключом, или None
+        """
+        action = db.session.query(cls.action).filter(cls.staff_id == staff_id, cls.key == key).scalar()
+        db.session.remove()
+        return action
+
+    @classmethod
+    def recorded(cls, keys):
+        """
+        Записанные ключи из набора пар (staff_id, key): (staff_id, key) -> действие
+        """
+        if not keys:
+            return {}
+        return {(staff_id, key): action for staff_id, key, action in
+                db.session.query(cls.staff_id, cls.key, cls.action).filter(tuple_(cls.staff_id, cls.key).in_(keys))}
+
+    @classmethod
+    def replay(cls, staff_id, key, action, status):
+        """
+        Статус повтора: 'ok', если запрос с этим ключом уже записал то же действие, иначе status
+        """
+        return 'ok' if key and cls.lookup(staff_id=staff_id, key=key) == action else status
+
+    @classmethod
+    def delete_expired(cls):
+        deleted = cls.query.filter(cls.expires <= datetime.datetime.now()).delete(synchronize_session=False)
+        db.session.commit()
+        db.session.remove()
+        return deleted
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.staff_id!r} {self.key!r} {self.action!r}>'
+
+
+class Device(db.Model):
+    """
+    Устройство сотрудника (MAC-адрес) для автоматической отметки по Wi-Fi (см. wifi.py)
+    """
+    __tablename__ = 'device'
+    id = db.Column(db.Integer, primary_key=True)
+    mac = db.Column(db.String(17), unique=True, nullable=False)
+    title = db.Column(db.String(50), nullable=True)
+    staff_id = db.Column(db.Integer(), db.ForeignKey('staff.id'), nullable=False, index=True)
+
+    def __init__(self, mac=None, staff_id=None, title=None):
+        self.mac = mac
+        self.staff_id = staff_id
+        self.title = title
+
+    @classmethod
+    def add_device(cls, staff_id=None, mac=None, title=None):
+        """
+        Метод привязки устройства к сотруднику
+        """
+        mac = normalize_mac(mac or '')
+        if not mac:
+            return 'unacceptable value'
+
+        if not db.session.get(Staff, staff_id):
+            db.session.remove()
+            return None
+
+        try:
+            db.session.add(cls(mac=mac, staff_id=staff_id, title=title))
+            db.session.commit()
+            db.session.remove()
+            return 'ok'
+        except sqlalchemy.exc.IntegrityError as error:
+            db.session.rollback()
+            db.session.remove()
+
+            if 'UNIQUE' in str(error):
+                return 'not unique'
+            return f'{error}'
+
+    @classmethod
+    def mac_map(cls):
+        """
+        Метод отдает словарь MAC -> staff_id всех устройств
+        """
+        devices = dict(db.session.query(cls.mac, cls.staff_id).all())
+        db.session.remove()
+        return devices
+
+    def __repr__(self):
+        return f'<Device {self.mac!r} {self.staff_id!r}>'
+
+
+for _statement in STAFF_SEARCH_DDL:
+    event.listen(Staff.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+for _statement in STAFF_TRIGRAM_DDL:
+    event.listen(Staff.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import tempfile
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, abort, current_app, send_from_directory
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+photos = Blueprint('photos', __name__)
+
+CHUNK_SIZE = 64 * 1024
+# запас на поля формы и заголовки multipart сверх PHOTO_MAX_SIZE
+FORM_OVERHEAD = 64 * 1024
+# сигнатуры поддерживаемых форматов -> расширение файла
+SIGNATURES = {b'\xff\xd8\xff': 'jpg', b'\x89PNG\r\n\x1a\n': 'png', b'RIFF': 'webp'}
+
+# миниатюры строятся вне потока запроса
+thumbnail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+
+
+def photo_dir():
+    return current_app.config['PHOTO_DIR'] or os.path.join(current_app.instance_path, 'photos')
+
+
+def thumbnail_name(name):
+    return f'{name.rsplit(".", 1)[0]}.thumb.jpg'
+
+
+def photo_url(name):
+    return f'/photos/{name}' if name else None
+
+
+def thumbnail_url(name):
+    return f'/photos/thumb/{name}' if name else None
+
+
+def upload_limit():
+    """
+    Предельный размер тела запроса загрузки фото: больший запрос отклоняется (413) до чтения файла
+    """
+    return current_app.config['PHOTO_MAX_SIZE'] + FORM_OVERHEAD
+
+
+def image_extension(head):
+    for signature, extension in SIGNATURES.items():
+        if head.startswith(signature) and (extension != 'webp' or head[8:12] == b'WEBP'):
+            return extension
+    return None
+
+
+def make_thumbnail(directory, name, size):
+    """
+    Построить миниатюру size x size (обрезка по центру) рядом с оригиналом
+    """
+    target = os.path.join(directory, thumbnail_name(name))
+    if os.path.exists(target):
+        return
+
+    with Image.open(os.path.join(directory, name)) as image:
+        image = image.convert('RGB')
+        side = min(image.size)
+        left, top = (image.width - side) // 2, (image.height - side) // 2
+        image = image.crop((left, top, left + side, top + side)).resize((size, size), Image.LANCZOS)
+
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            image.save(file, 'JPEG', quality=85)
+        os.replace(temp, target)
+
+
+def thumbnail_done(logger, name, future):
+    """
+    Ошибка построения миниатюры иначе осталась бы в future и потерялась
+    """
+    error = future.exception()
+    if error is not None:
+        logger.error('thumbnail for %s failed', name, exc_info=error)
+
+
+def save_photo(stream):
+    """
+    Сохранить загруженное фото: поток пишется на диск порциями с подсчетом sha256,
+    файл получает имя по содержимому (одинаковые фото хранятся один раз).
+    Возвращает имя файла или None, если это не jpeg/png/webp или файл слишком большой
+    """
+    directory = photo_dir()
+    os.makedirs(directory, exist_ok=True)
+    max_size = current_app.config['PHOTO_MAX_SIZE']
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            while chunk := stream.read(CHUNK_SIZE):
+                if len(head) < 16:
+                    head += chunk[:16]
+                size += len(chunk)
+                if size > max_size:
+                    return None
+                digest.update(chunk)
+                file.write(chunk)
+
+        extension = image_extension(head)
+        if extension is None:
+            return None
+
+        name = f'{digest.hexdigest()[:32]}.{extension}'
+        os.replace(temp, os.path.join(directory, name))
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+    if Image is not None:
+        future = thumbnail_executor.submit(make_thumbnail, directory, name, current_app.config['PHOTO_THUMBNAIL_SIZE'])
+        future.add_done_callback(partial(thumbnail_done, current_app.logger, name))
+    return name
+
+
+def send_photo(name, immutable=True):
+    response = send_from_directory(photo_dir(), name, conditional=True, etag=True,
+                                   max_age=31536000 if immutable else 60)
+    response.cache_control.public = True
+    response.cache_control.immutable = immutable or None
+    return response
+
+
+@photos.get('/photos/<name>')
+def photo(name):
+    return send_photo(name)
+
+
+@photos.get('/photos/thumb/<name>')
+def thumbnail(name):
+    """
+    Миниатюра фото; пока она не построена - оригинал с коротким кэшированием
+    """
+    if os.path.exists(os.path.join(photo_dir(), thumbnail_name(name))):
+        return send_photo(thumbnail_name(name))
+    if not os.path.exists(os.path.join(photo_dir(), name)):
+        abort(404)
+    return send_photo(name, immutable=False)
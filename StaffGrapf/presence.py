@@ -0,0 +1,111 @@
+import datetime
+import threading
+import time
+from sqlalchemy import select
+from .tenants import TenantLocal
+
+
+PRESENCE_CHECK_INTERVAL = 30
+
+# больше стольких новых событий журнала - кэш перечитывается целиком
+PRESENCE_CATCH_UP_LIMIT = 1000
+
+
+class PresenceRegistry:
+    """
+    Кэш "кто сейчас на работе" в памяти процесса.
+
+    Хранит открытые маркеры (staff_id -> id маркера) и сегодняшние маркеры (id -> словарь).
+    Прогревается из базы в create_app(), дальше обновляется методами Marker после commit.
+    Раз в check_interval секунд дочитывает журнал marker_event (запрос по id) и перечитывает
+    маркеры, которые изменили другие процессы, включая правки времени и причин.
+    """
+
+    def __init__(self, check_interval=PRESENCE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._day = None
+        self._open = {}
+        self._today = {}
+        self._event_id = 0
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _day_range(day):
+        start = datetime.datetime.combine(day, datetime.time.min)
+        return start, start + datetime.timedelta(days=1)
+
+    def warm(self):
+        """
+        Загрузить открытые и сегодняшние маркеры из базы
+        """
+        from .models import MarkerEvent
+        from .projections import MARKER
+
+        day = datetime.date.today()
+        start, end = self._day_range(day)
+        # сначала водяной знак: изменения во время загрузки применятся при следующей проверке
+        event_id = MarkerEvent.last_id()
+
+        open_markers = dict(MARKER.rows(select(MARKER.c.staff_id, MARKER.c.id).where(MARKER.c.time_out == None)).all())
+        today = {marker['id']: marker for marker in
+                 MARKER.dicts(MARKER.select(MARKER.c.time_in >= start, MARKER.c.time_in < end))}
+
+        with self._lock:
+            self._day = day
+            self._open = open_markers
+            self._today = today
+            self._event_id = event_id
+            self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        day = datetime.date.today()
+        if self._day != day:
+            self.warm()
+            return
+
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+
+        from .models import MarkerEvent
+        from .projections import MARKER
+
+        events = MarkerEvent.since(self._event_id, PRESENCE_CATCH_UP_LIMIT)
+        if len(events) == PRESENCE_CATCH_UP_LIMIT:
+            self.warm()
+            return
+
+        if events:
+            marker_ids = {event.marker_id for event in events}
+            self.record(MARKER.dicts(MARKER.select(MARKER.c.id.in_(marker_ids))))
+            self._event_id = events[-1].id
+        self._checked_at = time.monotonic()
+
+    def record(self, markers):
+        """
+        Применить записанные в базу маркеры (словари с полями маркера)
+        """
+        with self._lock:
+            if self._day is None:
+                return
+
+            start, end = self._day_range(self._day)
+            for marker in markers:
+                if marker['time_out'] is None:
+                    self._open[marker['staff_id']] = marker['id']
+                elif self._open.get(marker['staff_id']) == marker['id']:
+                    del self._open[marker['staff_id']]
+
+                if marker['time_in'] is not None and start <= marker['time_in'] < end:
+                    self._today[marker['id']] = marker
+                else:
+                    self._today.pop(marker['id'], None)
+
+    def today_markers(self):
+        self._ensure_fresh()
+        with self._lock:
+            return [self._today[marker_id] for marker_id in sorted(self._today)]
+
+
+# у каждой организации свой кэш присутствия
+presence = TenantLocal(PresenceRegistry)
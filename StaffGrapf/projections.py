@@ -0,0 +1,60 @@
+from functools import cached_property
+from sqlalchemy import select
+from . import db, schemas
+
+
+class Projection:
+    """
+    Набор столбцов таблицы для чтения в обход ORM.
+
+    Запрос строится на Core select() и выполняется на соединении текущей сессии:
+    строки приходят легкими Row-кортежами в порядке fields, без объектов модели,
+    identity map и загрузки лишних столбцов (например, password).
+    Одно определение на эндпоинт - столбцы запроса и поля ответа не расходятся
+    """
+
+    def __init__(self, table_name, fields, serializer=None):
+        self.table_name = table_name
+        self.fields = tuple(fields)
+        self.serializer = serializer
+
+    @cached_property
+    def table(self):
+        return db.metadata.tables[self.table_name]
+
+    @property
+    def c(self):
+        return self.table.c
+
+    @cached_property
+    def columns(self):
+        return [self.table.c[field] for field in self.fields]
+
+    def select(self, *where):
+        return select(*self.columns).where(*where)
+
+    def rows(self, statement, chunk_size=None):
+        result = db.session.connection().execute(statement)
+        if chunk_size:
+            result = result.yield_per(chunk_size)
+        return result
+
+    def dump(self, row):
+        if self.serializer is not None:
+            return self.serializer.dump_row(row)
+        return dict(zip(self.fields, row))
+
+    def dicts(self, statement, chunk_size=None):
+        """
+        Генератор словарей: запрос выполняется при первом next(), поэтому потоковый ответ
+        (stream_with_context) читает строки на соединении своей сессии, а не той,
+        что закрылась вместе с контекстом эндпоинта
+        """
+        yield from map(self.dump, self.rows(statement, chunk_size))
+
+
+# getStaff, getStaffsFromDepartment, searchStaff
+STAFF = Projection('staff', schemas.STAFF.fields, schemas.STAFF)
+
+# todayMarkers и кэш присутствия
+MARKER = Projection('marker', ('id', 'staff_id', 'time_in', 'time_out', 'reason_in', 'reason_out'))
@@ -0,0 +1,236 @@
+import io
+import csv
+import datetime
+import tempfile
+from sqlalchemy import func, case, select, union_all
+from . import db
+from .models import Department, Marker, MarkerDay, Staff
+from .archive import marker_source
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+def minutes_between(start, end):
+    """
+    SQL-выражение: число минут между двумя DateTime столбцами
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 1440
+    if dialect == 'postgresql':
+        return func.extract('epoch', end - start) / 60
+    return func.timestampdiff(db.text('MINUTE'), start, end)
+
+
+def as_date(value):
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    return value
+
+
+def day_range(date_from, date_to):
+    """
+    Полуинтервал [date_from 00:00, date_to + 1 день 00:00) для фильтра по time_in
+    """
+    start = datetime.datetime.combine(date_from, datetime.time.min)
+    return start, datetime.datetime.combine(date_to, datetime.time.min) + datetime.timedelta(days=1)
+
+
+def daily_rows(date_from, date_to, staff_ids=None):
+    """
+    Посуточная сводка маркеров (с учетом архива), посчитанная в базе одним GROUP BY:
+    (staff_id, day, first_in, last_out, minutes, open_count)
+    """
+    markers = marker_source(*day_range(date_from, date_to), staff_ids=staff_ids)
+    day = func.date(markers.c.time_in)
+    query = db.session.query(
+        markers.c.staff_id,
+        day,
+        func.min(markers.c.time_in),
+        func.max(markers.c.time_out),
+        func.coalesce(func.sum(minutes_between(markers.c.time_in, markers.c.time_out)), 0),
+        func.sum(case((markers.c.time_out == None, 1), else_=0))
+    )
+
+    for staff_id, day, first_in, last_out, minutes, open_count in query.group_by(markers.c.staff_id, day):
+        yield staff_id, as_date(day), first_in, last_out, minutes, open_count
+
+
+def rollup_rows(date_from, date_to, staff_ids=None):
+    """
+    Посуточная сводка из таблицы marker_day:
+    (staff_id, day, first_in, last_out, minutes, open_count, late)
+    """
+    query = db.session.query(MarkerDay.staff_id, MarkerDay.day, MarkerDay.first_in, MarkerDay.last_out,
+                             MarkerDay.minutes, MarkerDay.open_count, MarkerDay.late) \
+        .filter(MarkerDay.day >= date_from, MarkerDay.day <= date_to)
+
+    if staff_ids is not None:
+        query = query.filter(MarkerDay.staff_id.in_(staff_ids))
+
+    return query
+
+
+def attendance_report(date_from, date_to, group_by='staff', department_id=None):
+    """
+    Отчет по отработанному времени за период [date_from, date_to] по сводке marker_day:
+    отработанные часы, опоздания (относительно Staff.at_work), ранние уходы
+    (относительно Staff.from_work) и незакрытые смены - по сотрудникам или по отделам
+    """
+    staff_query = db.session.query(Staff.id, Staff.firstname, Staff.lastname, Staff.middle_name,
+                                   Staff.department_id, Staff.at_work, Staff.from_work)
+    if department_id is not None:
+        staff_query = staff_query.filter(Staff.department_id == department_id)
+
+    staffs = {row.id: row for row in staff_query}
+    totals = {staff_id: {'days': 0, 'minutes': 0.0, 'late': 0, 'early_leaves': 0, 'open_shifts': 0}
+              for staff_id in staffs}
+
+    staff_ids = list(staffs) if department_id is not None else None
+    for staff_id, day, first_in, last_out, minutes, open_count, late in rollup_rows(date_from, date_to, staff_ids):
+        staff = staffs.get(staff_id)
+        if staff is None:
+            continue
+
+        total = totals[staff_id]
+        total['days'] += 1
+        total['minutes'] += minutes or 0
+        total['open_shifts'] += open_count or 0
+        if late:
+            total['late'] += 1
+        if staff.from_work and last_out and not open_count and last_out.time() < staff.from_work:
+            total['early_leaves'] += 1
+
+    if group_by == 'department':
+        departments = {}
+        for staff_id, total in totals.items():
+            department = departments.setdefault(staffs[staff_id].department_id, {
+                'department_id': staffs[staff_id].department_id, 'staff': 0,
+                'days': 0, 'minutes': 0.0, 'late': 0, 'early_leaves': 0, 'open_shifts': 0})
+            department['staff'] += 1
+            for key, value in total.items():
+                department[key] += value
+        rows = list(departments.values())
+    else:
+        rows = [{'staff_id': staff_id,
+                 'firstname': staffs[staff_id].firstname,
+                 'lastname': staffs[staff_id].lastname,
+                 'middle_name': staffs[staff_id].middle_name,
+                 'department_id': staffs[staff_id].department_id,
+                 **total} for staff_id, total in totals.items()]
+
+    for row in rows:
+        row['worked_hours'] = round(row.pop('minutes') / 60, 2)
+
+    return rows
+
+
+def presence_dashboard(department_id=None, now=None):
+    """
+    Кто сейчас на работе по отделам: пришедшие и не ушедшие (in), ушедшие (out),
+    опоздавшие сегодня (late, среди in и out) и не приходившие (absent) - счетчики и списки.
+    Считается одним запросом: сотрудник + отдел + его открытые и сегодняшние маркеры, GROUP BY сотрудника
+    """
+    now = now or datetime.datetime.now()
+    start = datetime.datetime.combine(now.date(), datetime.time.min)
+
+    # открытые (по ix_marker_open) и сегодняшние закрытые (по ix_marker_time_in) маркеры:
+    # объем не зависит от длины истории
+    columns = (Marker.id, Marker.staff_id, Marker.time_in, Marker.time_out)
+    markers = union_all(
+        select(*columns).where(Marker.time_out == None),
+        select(*columns).where(Marker.time_in >= start, Marker.time_out != None)
+    ).subquery('markers')
+
+    query = db.session.query(
+        Staff.id, Staff.firstname, Staff.lastname, Staff.middle_name, Staff.at_work, Staff.department_id,
+        Department.title,
+        func.min(markers.c.time_in).filter(markers.c.time_in >= start),
+        func.max(markers.c.time_out).filter(markers.c.time_in >= start),
+        func.count(markers.c.id).filter(markers.c.time_out == None)
+    ).outerjoin(Department, Department.id == Staff.department_id) \
+        .outerjoin(markers, markers.c.staff_id == Staff.id) \
+        .filter(Staff.active == True).group_by(Staff.id, Department.title).order_by(Staff.lastname, Staff.firstname)
+
+    if department_id is not None:
+        query = query.filter(Staff.department_id == department_id)
+
+    departments = {}
+    for staff_id, firstname, lastname, middle_name, at_work, staff_department_id, title, first_in, last_out, \
+            open_count in query:
+        department = departments.setdefault(staff_department_id, {
+            'department_id': staff_department_id, 'title': title, 'in': 0, 'out': 0, 'late': 0, 'absent': 0,
+            'staff': {'in': [], 'out': [], 'absent': []}})
+
+        late = bool(first_in and at_work and first_in.time() > at_work)
+        state = 'in' if open_count else ('out' if first_in else 'absent')
+        department[state] += 1
+        department['late'] += late
+        department['staff'][state].append({'id': staff_id, 'firstname': firstname, 'lastname': lastname,
+                                           'middle_name': middle_name, 'first_in': first_in,
+                                           'last_out': None if open_count else last_out, 'late': late})
+
+    return list(departments.values())
+
+
+TIMESHEET_HEADER = ('staff_id', 'lastname', 'firstname', 'middle_name', 'department', 'time_in', 'time_out',
+                    'minutes', 'reason_in', 'reason_out')
+EXPORT_CHUNK_SIZE = 1000
+
+
+def timesheet_rows(date_from, date_to):
+    """
+    Маркеры за период (с учетом архива) вместе с сотрудником и отделом, читаются из базы порциями
+    """
+    markers = marker_source(*day_range(date_from, date_to))
+    query = db.session.query(
+        markers.c.staff_id, Staff.lastname, Staff.firstname, Staff.middle_name, Department.title,
+        markers.c.time_in, markers.c.time_out, markers.c.reason_in, markers.c.reason_out
+    ).join(Staff, Staff.id == markers.c.staff_id).outerjoin(Department, Department.id == Staff.department_id) \
+        .order_by(markers.c.time_in, markers.c.id).yield_per(EXPORT_CHUNK_SIZE)
+
+    for staff_id, lastname, firstname, middle_name, department, time_in, time_out, reason_in, reason_out in query:
+        minutes = round((time_out - time_in).total_seconds() / 60) if time_out else None
+        yield (staff_id, lastname, firstname, middle_name, department, time_in, time_out,
+               minutes, reason_in, reason_out)
+
+
+def timesheet_csv(date_from, date_to):
+    """
+    Генератор CSV табеля: отдается порциями по EXPORT_CHUNK_SIZE строк
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TIMESHEET_HEADER)
+
+    for number, row in enumerate(timesheet_rows(date_from, date_to), 1):
+        writer.writerow(row)
+        if number % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def timesheet_xlsx(date_from, date_to):
+    """
+    Генератор XLSX табеля. Книга пишется openpyxl в write-only режиме
+    во временный файл (память не растет с числом строк) и затем отдается порциями.
+    Первый байт уходит только после того, как записана вся книга, поэтому период
+    ограничивается в exportTimesheet (TIMESHEET_XLSX_MAX_DAYS)
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('timesheet')
+    sheet.append(TIMESHEET_HEADER)
+    for row in timesheet_rows(date_from, date_to):
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as file:
+        workbook.save(file)
+        file.seek(0)
+        while chunk := file.read(64 * 1024):
+            yield chunk
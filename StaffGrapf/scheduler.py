@@ -0,0 +1,131 @@
+import time
+import atexit
+import datetime
+import threading
+from . import db
+from .tenants import tenants
+
+
+TOKEN_CLEANUP_INTERVAL = 3600
+IDEMPOTENCY_CLEANUP_INTERVAL = 3600
+MARKER_EVENTS_CLEANUP_INTERVAL = 3600
+
+
+def close_stale_markers(app):
+    """
+    Задача: закрыть забытые открытые маркеры (Marker.close_stale)
+    """
+    from .models import Marker
+
+    return sum(Marker.close_stale(grace=datetime.timedelta(minutes=app.config['AUTO_CLOSE_GRACE']),
+                                  max_shift=datetime.timedelta(hours=app.config['AUTO_CLOSE_MAX_SHIFT']),
+                                  chunk_size=app.config['AUTO_CLOSE_CHUNK_SIZE']))
+
+
+def delete_expired_tokens(app):
+    """
+    Задача: удалить истекшие сессии
+    """
+    from .models import SessionToken
+
+    return SessionToken.delete_expired()
+
+
+def delete_expired_idempotency_keys(app):
+    """
+    Задача: удалить истекшие ключи идемпотентности
+    """
+    from .models import IdempotencyKey
+
+    return IdempotencyKey.delete_expired()
+
+
+def delete_old_marker_events(app):
+    """
+    Задача: удалить старые события журнала marker_event
+    """
+    from .models import MarkerEvent
+
+    return MarkerEvent.delete_old(datetime.datetime.now()
+                                  - datetime.timedelta(hours=app.config['MARKER_EVENTS_KEEP_HOURS']))
+
+
+class Scheduler:
+    """
+    Периодические задачи в фоновом потоке процесса.
+
+    Задача - функция от приложения, выполняется в app_context раз в interval секунд
+    (первый раз - через interval после старта) по очереди для каждой организации.
+    Ошибка задачи пишется в лог и не останавливает остальные. В каждом воркере свой планировщик, поэтому задачи должны быть идемпотентны.
+    Поток запускается только в обслуживающем запросы процессе: при SCHEDULER_ENABLED или через start()
+    (post_worker_init в gunicorn.conf.py, start_app.py); команды flask и бенчмарки его не запускают
+    """
+
+    def __init__(self):
+        self._app = None
+        self._jobs = []
+        self._thread = None
+        self._stopped = threading.Event()
+        self._registered = False
+
+    def init_app(self, app):
+        self.stop()
+        self._jobs = []
+        if app.config['AUTO_CLOSE_INTERVAL'] > 0:
+            self.add_job(close_stale_markers, app.config['AUTO_CLOSE_INTERVAL'])
+        if app.config['AUTH_ENABLED']:
+            self.add_job(delete_expired_tokens, TOKEN_CLEANUP_INTERVAL)
+        self.add_job(delete_expired_idempotency_keys, IDEMPOTENCY_CLEANUP_INTERVAL)
+        self.add_job(delete_old_marker_events, MARKER_EVENTS_CLEANUP_INTERVAL)
+        self._app = app
+        if app.config['SCHEDULER_ENABLED']:
+            self.start()
+
+    def start(self):
+        """
+        Запустить поток задач приложения, переданного в init_app
+        """
+        if not self._jobs or self._thread is not None:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+        if not self._registered:
+            atexit.register(self.stop)
+            self._registered = True
+
+    def add_job(self, function, interval):
+        self._jobs.append({'function': function, 'interval': interval, 'next_run': time.monotonic() + interval})
+
+    def _run_job(self, job):
+        name = job['function'].__name__
+        with self._app.app_context():
+            for tenant in tenants.each():
+                try:
+                    result = job['function'](self._app)
+                    self._app.logger.debug('%s [%s]: %s', name, tenant or 'default', result)
+                except Exception:
+                    db.session.rollback()
+                    self._app.logger.exception('%s [%s] failed', name, tenant or 'default')
+                finally:
+                    db.session.remove()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            for job in self._jobs:
+                if job['next_run'] <= time.monotonic():
+                    self._run_job(job)
+                    job['next_run'] = time.monotonic() + job['interval']
+            self._stopped.wait(max(min(job['next_run'] for job in self._jobs) - time.monotonic(), 0))
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+
+scheduler = Scheduler()
@@ -0,0 +1,227 @@
+import datetime
+from collections.abc import Mapping
+from flask.json.provider import DefaultJSONProvider
+from .photos import thumbnail_url
+from .additional_functions import normalize_mac
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+UNACCEPTABLE_VALUE = ('unacceptable value', 406)
+NOT_VALUE = ('not value', 400)
+TOO_LONG = ('no value or too long', 400)
+
+
+class ValidationError(ValueError):
+    """
+    Поле запроса отсутствует или не проходит проверку: отдается как {'status': status} с кодом code
+    """
+
+    def __init__(self, field=None, error=UNACCEPTABLE_VALUE):
+        super().__init__(field)
+        self.field = field
+        self.status, self.code = error
+
+
+# Парсеры полей: значение из JSON -> значение для модели. Мусор - ValueError/TypeError
+
+
+def integer(value):
+    if isinstance(value, bool):
+        raise TypeError(value)
+    return int(value)
+
+
+def text(max_length=None):
+    def parse(value):
+        if not isinstance(value, str) or (max_length and len(value) > max_length):
+            raise ValueError(value)
+        return value
+    return parse
+
+
+def boolean(value):
+    if not isinstance(value, bool):
+        raise TypeError(value)
+    return value
+
+
+def clock_time(value):
+    return datetime.datetime.strptime(value, '%H:%M').time()  # '07:00'
+
+
+def iso_date(value):
+    return datetime.date.fromisoformat(value)  # '%Y-%m-%d'
+
+
+def mac_address(value):
+    mac = normalize_mac(value)
+    if mac is None:
+        raise ValueError(value)
+    return mac
+
+
+def choice(*values):
+    def parse(value):
+        if value not in values:
+            raise ValueError(value)
+        return value
+    return parse
+
+
+def many(schema, max_items=None):
+    def parse(value):
+        if not isinstance(value, list) or (max_items and len(value) > max_items):
+            raise ValueError(value)
+        return [schema.load(item) for item in value]
+    return parse
+
+
+class Field:
+    """
+    parse - парсер значения, key - ключ в запросе (по умолчанию имя поля).
+    Пустое значение (нет ключа, None или '') дает default, а для required поля - ошибку error
+    """
+
+    def __init__(self, parse=text(), required=True, default=None, key=None, error=UNACCEPTABLE_VALUE):
+        self.parse = parse
+        self.required = required
+        self.default = default
+        self.key = key
+        self.error = error
+
+
+class Schema:
+    """
+    Схема входных данных: load(data) -> словарь именованных аргументов для модели.
+    Поля разворачиваются в кортежи при создании схемы, load только проходит по ним.
+    partial - схема изменения: поля, которого нет в запросе, нет и в результате,
+    а required запрещает только пустое значение
+    """
+
+    def __init__(self, partial=False, **fields):
+        self.partial = partial
+        self._fields = tuple((name, field.key or name, field.parse, field.required, field.default, field.error)
+                             for name, field in fields.items())
+
+    def load(self, data):
+        if not isinstance(data, Mapping):
+            raise ValidationError()
+
+        result = {}
+        for name, key, parse, required, default, error in self._fields:
+            if self.partial and key not in data:
+                continue
+            value = data.get(key)
+            if value is None or value == '':
+                if required:
+                    raise ValidationError(key, error)
+                result[name] = default
+                continue
+            try:
+                result[name] = parse(value)
+            except (TypeError, ValueError):
+                raise ValidationError(key, error) from None
+        return result
+
+
+class Serializer:
+    """
+    Схема ответа: словарь fields (+ вычисляемые поля computed: имя -> (поле-источник, функция)).
+
+    dump_row(row) собирает ответ по позициям из строки запроса (см. projections.Projection),
+    без загрузки объектов ORM
+    """
+
+    def __init__(self, *fields, **computed):
+        self.fields = fields
+        self._computed = tuple((name, fields.index(source), function)
+                               for name, (source, function) in computed.items())
+
+    def dump_row(self, values):
+        row = dict(zip(self.fields, values))
+        for name, index, function in self._computed:
+            row[name] = function(values[index])
+        return row
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    JSON через orjson (если установлен). Даты отдаются так же, как в стандартном провайдере
+    """
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+# Ответы
+
+STAFF = Serializer('id', 'photo', 'appointment', 'firstname', 'lastname', 'middle_name', 'gender', 'phone',
+                   'email', 'active', 'department_id', thumbnail=('photo', thumbnail_url))
+
+
+# Запросы
+
+LOGIN = Schema(phone=Field(text(12)), password=Field(text(128)))
+STAFF_ID = Schema(staff_id=Field(integer))
+# фото меняет только loadPhoto (имя файла по содержимому)
+STAFF_FIELDS = dict(appointment=Field(text(50), required=False, error=TOO_LONG),
+                    firstname=Field(text(50), error=TOO_LONG),
+                    lastname=Field(text(50), error=TOO_LONG),
+                    middle_name=Field(text(50), required=False, error=TOO_LONG),
+                    phone=Field(text(12), required=False, error=TOO_LONG),
+                    email=Field(text(50), required=False, error=TOO_LONG),
+                    gender=Field(boolean),  # True/False
+                    at_work=Field(clock_time, required=False),  # '07:00'
+                    from_work=Field(clock_time, required=False),  # '20:00'
+                    active=Field(boolean, required=False, default=True),
+                    admin=Field(boolean, required=False, default=False),
+                    department_id=Field(integer, required=False))
+STAFF_CREATE = Schema(**STAFF_FIELDS, password=Field(text(128), error=TOO_LONG))
+# меняются только переданные поля, без пароля остается прежний
+STAFF_EDIT = Schema(partial=True, **STAFF_FIELDS,
+                    password=Field(text(128), required=False, error=TOO_LONG))
+STAFF_IN_DEPARTMENT = Schema(department_id=Field(integer), staff_id=Field(integer))
+DEPARTMENT_PAGE = Schema(department_id=Field(integer))
+SEARCH = Schema(query=Field(text(), key='q', error=NOT_VALUE),
+                page=Field(integer, required=False, default=1),
+                per_page=Field(integer, required=False))
+MARKER_EVENT = Schema(staff_id=Field(integer, key='staff'),
+                      reason=Field(required=False))
+MARKER_BATCH_EVENT = Schema(staff_id=Field(integer, key='staff'),
+                            reason=Field(required=False),
+                            action=Field(choice('in', 'out')),
+                            idempotency_key=Field(text(64), required=False))
+IDEMPOTENCY_KEY = Schema(key=Field(text(64), required=False, key='Idempotency-Key'))
+MARKER_BATCH = Schema(events=Field(many(MARKER_BATCH_EVENT)))
+MARKER_EDIT = Schema(marker_id=Field(integer),
+                     time_in=Field(required=False),  # '%Y-%m-%d %H:%M'
+                     reason_in=Field(required=False),
+                     time_out=Field(required=False),  # '%Y-%m-%d %H:%M'
+                     reason_out=Field(required=False))
+MARKER_BY_ADMIN = Schema(staff_id=Field(integer, key='marker_id'),
+                         time_in=Field(required=False),  # '%Y-%m-%d %H:%M'
+                         reason_in=Field(required=False),
+                         time_out=Field(required=False),  # '%Y-%m-%d %H:%M'
+                         reason_out=Field(required=False))
+PRESENCE_DASHBOARD = Schema(department_id=Field(integer, required=False))
+ATTENDANCE_REPORT = Schema(date_from=Field(iso_date),
+                           date_to=Field(iso_date),  # включительно
+                           department_id=Field(integer, required=False),
+                           group_by=Field(choice('staff', 'department'), required=False, default='staff'))
+TIMESHEET = Schema(date_from=Field(iso_date),
+                   date_to=Field(iso_date),  # включительно
+                   export_format=Field(choice('csv', 'xlsx'), required=False, default='csv', key='format'))
+DEVICE = Schema(staff_id=Field(integer),
+                mac=Field(mac_address),
+                title=Field(text(50), required=False))
+DEPARTMENT = Schema(title=Field(text(25), error=TOO_LONG))
+DEPARTMENT_EDIT = Schema(department_id=Field(integer),
+                         title=Field(text(25), error=TOO_LONG))
@@ -0,0 +1,197 @@
+import io
+import csv
+import json
+import datetime
+import sqlalchemy.exc
+from . import db
+from .models import Staff
+from .cache import cache
+from .auth import auth
+
+
+IMPORT_BATCH_SIZE = 500
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет'}
+STRING_FIELDS = {'photo': 50, 'appointment': 50, 'firstname': 50, 'lastname': 50, 'middle_name': 50,
+                 'phone': 12, 'email': 50, 'password': 128, 'password_hash': 255}
+REQUIRED_FIELDS = ('firstname', 'lastname')
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(file, filename):
+    """
+    Построчно читает бинарный файл импорта: .csv (с заголовком),
+    .jsonl (объект на строку) или .json (массив объектов, читается целиком).
+    Вместо нечитаемой строки .jsonl отдается RowError: она попадает в отчет, импорт продолжается
+    """
+    if filename.endswith('.json'):
+        rows = json.load(file)
+        if not isinstance(rows, list):
+            raise RowError('json must be an array')
+        yield from rows
+        return
+
+    if filename.endswith('.jsonl'):
+        # строки декодируются по одной: битая кодировка тоже ошибка одной строки
+        for line in file:
+            try:
+                line = line.decode('utf-8-sig')
+                if line.strip():
+                    yield json.loads(line)
+            except ValueError as error:
+                yield RowError(f'bad json: {error}')
+        return
+
+    yield from csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+
+
+def to_bool(value, default=None):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == '':
+        if default is None:
+            raise RowError('empty boolean')
+        return default
+
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'bad boolean {value!r}')
+
+
+def to_time(value):
+    """
+    '07:00' -> datetime.time(7, 0), пустое значение -> None
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(str(value).strip(), '%H:%M').time()
+    except ValueError:
+        raise RowError(f'bad time {value!r}')
+
+
+def normalize_row(row, now):
+    """
+    Проверить и привести строку импорта к словарю столбцов staff
+    """
+    data = {}
+    for field, max_length in STRING_FIELDS.items():
+        value = row.get(field)
+        value = str(value).strip() if value is not None else ''
+        if len(value) > max_length:
+            raise RowError(f'{field} is too long')
+        data[field] = value or None
+
+    for field in REQUIRED_FIELDS:
+        if not data[field]:
+            raise RowError(f'{field} is required')
+    # пароль открытым текстом или готовый хэш werkzeug (перенос из другой системы)
+    if not data['password'] and not data['password_hash']:
+        raise RowError('password is required')
+    if data['password_hash'] and not auth.is_hash(data['password_hash']):
+        raise RowError('bad password_hash')
+
+    data['gender'] = to_bool(row.get('gender'))
+    data['active'] = to_bool(row.get('active'), default=True)
+    data['admin'] = to_bool(row.get('admin'), default=False)
+    data['at_work'] = to_time(row.get('at_work'))
+    data['from_work'] = to_time(row.get('from_work'))
+
+    department_id = row.get('department_id')
+    try:
+        data['department_id'] = int(department_id) if department_id not in (None, '') else None
+    except (TypeError, ValueError):
+        raise RowError(f'bad department_id {department_id!r}')
+
+    data['created'] = now
+    return data
+
+
+def _insert_batch(batch, report):
+    """
+    batch - список (номер строки, словарь столбцов) с уже проверенной уникальностью телефонов
+    """
+    try:
+        db.session.bulk_insert_mappings(Staff, [data for _, data in batch])
+        db.session.commit()
+        for number, _ in batch:
+            report.append({'row': number, 'status': 'ok'})
+        return
+    except sqlalchemy.exc.IntegrityError:
+        db.session.rollback()
+
+    # кто-то успел вставить такой же телефон параллельно - вставляем по одной, чтобы найти виноватых
+    for number, data in batch:
+        try:
+            db.session.bulk_insert_mappings(Staff, [data])
+            db.session.commit()
+            report.append({'row': number, 'status': 'ok'})
+        except sqlalchemy.exc.IntegrityError as error:
+            db.session.rollback()
+            report.append({'row': number, 'status': 'not unique' if 'UNIQUE' in str(error) else f'{error}'})
+
+
+def import_staff(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Массовый импорт персонала.
+
+    Строки проверяются и нормализуются порциями по batch_size, занятые телефоны
+    проверяются одним запросом на порцию, каждая порция вставляется одним bulk INSERT
+    в своей транзакции. Возвращает отчет [{'row': номер, 'status': 'ok' | ошибка}]
+    """
+    now = datetime.datetime.now().replace(microsecond=0)
+    report = []
+    seen_phones = set()
+    batch = []
+
+    def flush():
+        phones = {data['phone'] for _, data in batch if data['phone']}
+        taken = {phone for phone, in db.session.query(Staff.phone).filter(Staff.phone.in_(phones))} if phones else set()
+
+        valid = []
+        for number, data in batch:
+            if data['phone'] and (data['phone'] in taken or data['phone'] in seen_phones):
+                report.append({'row': number, 'status': 'not unique'})
+                continue
+            if data['phone']:
+                seen_phones.add(data['phone'])
+            valid.append((number, data))
+
+        if valid:
+            plain = [data for _, data in valid if not data['password_hash']]
+            for data, password in zip(plain, auth.hash_passwords([data['password'] for data in plain])):
+                data['password'] = password
+            for _, data in valid:
+                password_hash = data.pop('password_hash')
+                if password_hash:
+                    data['password'] = password_hash
+            _insert_batch(valid, report)
+        batch.clear()
+
+    for number, row in enumerate(rows, 1):
+        try:
+            if isinstance(row, RowError):
+                raise row
+            if not isinstance(row, dict):
+                raise RowError('row must be an object')
+            batch.append((number, normalize_row(row, now)))
+        except RowError as error:
+            report.append({'row': number, 'status': f'{error}'})
+            continue
+
+        if len(batch) == batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    db.session.remove()
+    cache.bump('staff')
+    report.sort(key=lambda item: item['row'])
+    return report
@@ -0,0 +1,234 @@
+"""
+Автоматическая отметка прихода/ухода по подключению к корпоративному Wi-Fi.
+
+Строки логов (hostapd через syslog, RADIUS accounting) читаются из файла, UDP-сокета
+(syslog) или очереди в памяти, разбираются в события (MAC, 'in' | 'out'), MAC сопоставляется
+с сотрудником по таблице device, а дребезг подключений гасится Debouncer.
+Итоговые события пишутся пакетами через Marker.marker_batch.
+"""
+import re
+import time
+import queue
+import socket
+from collections import Counter
+from .additional_functions import normalize_mac
+
+
+WIFI_REASON = 'wifi'
+IDLE_TIMEOUT = 0.5
+
+HOSTAPD_EVENT = re.compile(r'AP-STA-(CONNECTED|DISCONNECTED) ([0-9A-Fa-f:]{17})')
+HOSTAPD_80211 = re.compile(r'STA ([0-9A-Fa-f:]{17}) IEEE 802\.11: (associated|disassociated|deauthenticated)')
+RADIUS_STATUS = re.compile(r'Acct-Status-Type\s*[=:]\s*"?(Start|Stop|Interim-Update)', re.IGNORECASE)
+RADIUS_MAC = re.compile(r'Calling-Station-Id\s*[=:]\s*"?([0-9A-Fa-f:.-]{12,17})', re.IGNORECASE)
+
+ACTIONS = {'CONNECTED': 'in', 'DISCONNECTED': 'out', 'associated': 'in', 'disassociated': 'out',
+           'deauthenticated': 'out', 'start': 'in', 'interim-update': 'in', 'stop': 'out'}
+
+
+def parse_line(line):
+    """
+    Событие из строки лога: (mac, 'in' | 'out') или None, если строка не о подключении.
+    Понимает hostapd (AP-STA-CONNECTED/DISCONNECTED и IEEE 802.11 associated/disassociated/deauthenticated)
+    и однострочные записи RADIUS accounting (Acct-Status-Type + Calling-Station-Id)
+    """
+    if 'AP-STA-' in line:
+        match = HOSTAPD_EVENT.search(line)
+        if match:
+            return normalize_mac(match[2]), ACTIONS[match[1]]
+    elif 'IEEE 802.11: ' in line:
+        match = HOSTAPD_80211.search(line)
+        if match:
+            return normalize_mac(match[1]), ACTIONS[match[2]]
+    elif 'Acct-Status-Type' in line:
+        status = RADIUS_STATUS.search(line)
+        mac = RADIUS_MAC.search(line)
+        if status and mac:
+            mac = normalize_mac(mac[1])
+            return (mac, ACTIONS[status[1].lower()]) if mac else None
+    return None
+
+
+# Источники строк: генераторы, которые отдают строку или None, если за IDLE_TIMEOUT ничего не пришло
+# (чтобы ингестор успевал сбрасывать пакеты и истекшие уходы)
+
+
+def file_source(path, follow=False):
+    """
+    Строки файла; follow - дальше ждать дописываемые строки, как tail -f
+    """
+    with open(path, encoding='utf-8', errors='replace') as file:
+        while True:
+            line = file.readline()
+            if line:
+                yield line
+            elif follow:
+                yield None
+                time.sleep(IDLE_TIMEOUT)
+            else:
+                return
+
+
+def udp_source(host='0.0.0.0', port=514):
+    """
+    Строки syslog по UDP (одна датаграмма - одна или несколько строк)
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((host, port))
+        sock.settimeout(IDLE_TIMEOUT)
+        while True:
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                yield None
+                continue
+            yield from data.decode('utf-8', errors='replace').splitlines()
+
+
+def queue_source(lines):
+    """
+    Строки из queue.Queue (локальная замена syslog/RADIUS для тестов и бенчмарков), None в очереди - конец
+    """
+    while True:
+        try:
+            line = lines.get(timeout=IDLE_TIMEOUT)
+        except queue.Empty:
+            yield None
+            continue
+        if line is None:
+            return
+        yield line
+
+
+class Debouncer:
+    """
+    Гасит дребезг подключений.
+
+    Сотрудник считается на месте, пока подключено хотя бы одно его устройство.
+    Приход отдается сразу (один раз), а уход - только если за delay секунд после отключения
+    последнего устройства ни одно не подключилось снова
+    """
+
+    def __init__(self, delay=120.0):
+        self.delay = delay
+        self._connected = {}
+        self._present = set()
+        self._leaving = {}
+
+    def push(self, staff_id, mac, action, now):
+        """
+        Применить событие устройства, возвращает 'in', если сотрудника нужно отметить пришедшим
+        """
+        macs = self._connected.setdefault(staff_id, set())
+        if action == 'in':
+            macs.add(mac)
+            if self._leaving.pop(staff_id, None) is not None or staff_id in self._present:
+                return None
+            self._present.add(staff_id)
+            return 'in'
+
+        macs.discard(mac)
+        if not macs and staff_id not in self._leaving:
+            self._leaving[staff_id] = now + self.delay
+        return None
+
+    def due(self, now):
+        """
+        Сотрудники, у которых истекло окно ухода (по порядку отключения)
+        """
+        left = []
+        for staff_id, deadline in self._leaving.items():
+            if deadline > now:
+                break
+            left.append(staff_id)
+        for staff_id in left:
+            del self._leaving[staff_id]
+            self._present.discard(staff_id)
+            self._connected.pop(staff_id, None)
+        return left
+
+    def drain(self):
+        """
+        Все ожидающие уходы сразу (конец конечного источника)
+        """
+        return self.due(float('inf'))
+
+
+class WifiIngestor:
+    """
+    Разбирает строки источника и пишет приходы/уходы пакетами через Marker.marker_batch:
+    пакет сбрасывается по batch_size событий или раз в flush_interval секунд.
+    Сопоставление MAC -> сотрудник перечитывается из таблицы device раз в devices_refresh секунд
+    """
+
+    def __init__(self, debounce=120.0, batch_size=500, flush_interval=1.0, devices_refresh=60.0,
+                 reason=WIFI_REASON, clock=time.monotonic):
+        self.debouncer = Debouncer(debounce)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.devices_refresh = devices_refresh
+        self.reason = reason
+        self.clock = clock
+        self.stats = Counter()
+        self._devices = {}
+        self._devices_at = None
+        self._events = []
+        self._flushed_at = clock()
+
+    def devices(self, now):
+        if self._devices_at is None or now - self._devices_at >= self.devices_refresh:
+            from .models import Device
+            self._devices = Device.mac_map()
+            self._devices_at = now
+        return self._devices
+
+    def feed(self, line, now):
+        self.stats['lines'] += 1
+        event = parse_line(line)
+        if event is None:
+            return
+
+        mac, action = event
+        staff_id = self.devices(now).get(mac)
+        if staff_id is None:
+            self.stats['unknown devices'] += 1
+            return
+
+        self.stats['events'] += 1
+        if self.debouncer.push(staff_id, mac, action, now) == 'in':
+            self._events.append({'staff_id': staff_id, 'reason': self.reason, 'action': 'in'})
+
+    def tick(self, now, drain=False):
+        left = self.debouncer.drain() if drain else self.debouncer.due(now)
+        self._events.extend({'staff_id': staff_id, 'reason': self.reason, 'action': 'out'} for staff_id in left)
+        if len(self._events) >= self.batch_size or (self._events and now - self._flushed_at >= self.flush_interval) \
+                or drain:
+            self.flush(now)
+
+    def flush(self, now):
+        from .models import Marker
+
+        self._flushed_at = now
+        events, self._events = self._events, []
+        for start in range(0, len(events), self.batch_size):
+            chunk = events[start:start + self.batch_size]
+            statuses = Marker.marker_batch(events=chunk)
+            for event, status in zip(chunk, statuses):
+                self.stats[f'{event["action"]} {status}'] += 1
+
+    def run(self, lines, drain=True):
+        """
+        Обработать источник до конца. drain - в конце записать и еще не истекшие уходы
+        """
+        ticked_at = self.clock()
+        for line in lines:
+            now = self.clock()
+            if line is not None:
+                self.feed(line, now)
+                if len(self._events) < self.batch_size and now - ticked_at < IDLE_TIMEOUT:
+                    continue
+            self.tick(now)
+            ticked_at = now
+        self.tick(self.clock(), drain=drain)
+        return self.stats
@@ -0,0 +1,127 @@
+import time
+import queue
+import atexit
+import threading
+from concurrent.futures import Future
+from .tenants import tenants
+
+
+class MarkerWriteQueue:
+    """
+    Очередь записи маркеров с групповым commit (включается настройкой MARKER_WRITE_BEHIND).
+
+    Эндпоинты markerIn/markerOut кладут событие в очередь и ждут Future с его статусом.
+    Один поток-писатель забирает из очереди все накопившиеся события (до batch_size)
+    и пишет их через Marker.marker_batch одной транзакцией, после commit
+    каждый запрос получает свой статус. У каждой организации своя очередь и свой поток-писатель
+    (создаются при первой записи), всплеск отметок одной организации не задерживает другие.
+    При остановке процесса очереди дописываются.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.batch_size = 500
+        self.linger = 0.0
+        self.timeout = 10.0
+        self._app = None
+        self._lock = threading.Lock()
+        self._writers = {}
+        self._registered = False
+
+    def init_app(self, app):
+        self.stop()
+        self.enabled = app.config['MARKER_WRITE_BEHIND']
+        if not self.enabled:
+            return
+
+        self.batch_size = app.config['MARKER_WRITE_BATCH_SIZE']
+        self.linger = app.config['MARKER_WRITE_LINGER']
+        self.timeout = app.config['MARKER_WRITE_TIMEOUT']
+        self._app = app
+        if not self._registered:
+            atexit.register(self.stop)
+            self._registered = True
+
+    def submit(self, staff_id, reason, action, idempotency_key=None):
+        """
+        Поставить событие в очередь, возвращает Future со статусом ('ok', 'still here', ...)
+        """
+        future = Future()
+        self._writer(tenants.current()).put(({'staff_id': staff_id, 'reason': reason, 'action': action,
+                                              'idempotency_key': idempotency_key}, future))
+        return future
+
+    def _writer(self, tenant):
+        with self._lock:
+            writer = self._writers.get(tenant)
+            if writer is None:
+                items = queue.Queue()
+                thread = threading.Thread(target=self._run, args=(tenant, items), daemon=True,
+                                          name=f'marker-writer-{tenant}' if tenant else 'marker-writer')
+                thread.start()
+                writer = self._writers[tenant] = (items, thread)
+            return writer[0]
+
+    def _collect(self, items, first):
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                item = items.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = items.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                items.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _write(self, tenant, batch):
+        from . import db
+        from .models import Marker
+
+        try:
+            with self._app.app_context(), tenants.use(tenant):
+                try:
+                    statuses = Marker.marker_batch(events=[event for event, _ in batch])
+                except Exception:
+                    # следующая пачка начинается с чистой сессии
+                    db.session.rollback()
+                    raise
+        except Exception as error:
+            # ошибка получает каждый запрос пачки, поток-писатель продолжает работу
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        for (_, future), status in zip(batch, statuses):
+            future.set_result(status)
+
+    def _run(self, tenant, items):
+        while True:
+            item = items.get()
+            if item is None:
+                return
+            self._write(tenant, self._collect(items, item))
+
+    def stop(self):
+        """
+        Дописать все, что уже в очередях, и остановить потоки-писатели
+        """
+        with self._lock:
+            writers = list(self._writers.values())
+            self._writers.clear()
+
+        for items, thread in writers:
+            items.put(None)
+        for items, thread in writers:
+            thread.join()
+
+
+write_queue = MarkerWriteQueue()
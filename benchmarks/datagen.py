@@ -0,0 +1,86 @@
+"""
+Генератор синтетических данных: отделы, персонал и маркеры за N дней.
+
+    python -m benchmarks.datagen --db /tmp/bench.db --staff 5000 --days 365
+"""
+import os
+import random
+import argparse
+import datetime
+from StaffGrapf import db, create_app
+from StaffGrapf.models import Department, Marker, MarkerDay, Staff
+
+
+FIRSTNAMES = ('Иван', 'Петр', 'Анна', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга', 'Дмитрий', 'Наталья')
+LASTNAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов', 'Михайлов',
+             'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов')
+CHUNK_SIZE = 10000
+
+
+def generate(staff=5000, departments=50, days=365, seed=0, today=None):
+    """
+    Заполнить пустую базу текущего приложения. Маркеров за сегодня нет -
+    их создают сценарии прихода в benchmarks.run
+    """
+    rng = random.Random(seed)
+    today = today or datetime.date.today()
+    now = datetime.datetime.now().replace(microsecond=0)
+
+    db.session.bulk_insert_mappings(Department, [{'title': f'Отдел {number}'} for number in range(departments)])
+    db.session.bulk_insert_mappings(Staff, [{
+        'firstname': rng.choice(FIRSTNAMES),
+        'lastname': f'{rng.choice(LASTNAMES)}{number}',
+        'middle_name': None,
+        'gender': rng.random() < 0.5,
+        'phone': f'+7{9000000000 + number}',
+        'password': 'password',
+        'active': True,
+        'admin': False,
+        'created': now,
+        'at_work': datetime.time(9),
+        'from_work': datetime.time(18),
+        'department_id': number % departments + 1
+    } for number in range(staff)])
+    db.session.commit()
+
+    markers = []
+    for offset in range(days, 0, -1):
+        day = datetime.datetime.combine(today - datetime.timedelta(days=offset), datetime.time.min)
+        if day.weekday() >= 5:
+            continue
+        for staff_id in range(1, staff + 1):
+            if rng.random() < 0.05:
+                continue
+            time_in = day + datetime.timedelta(minutes=rng.randint(8 * 60, 10 * 60))
+            time_out = day + datetime.timedelta(minutes=rng.randint(17 * 60, 19 * 60))
+            markers.append({'staff_id': staff_id, 'time_in': time_in, 'time_out': time_out,
+                            'reason_in': None, 'reason_out': None})
+            if len(markers) == CHUNK_SIZE:
+                db.session.bulk_insert_mappings(Marker, markers)
+                db.session.commit()
+                markers.clear()
+
+    db.session.bulk_insert_mappings(Marker, markers)
+    db.session.commit()
+
+    for _ in MarkerDay.rebuild(today - datetime.timedelta(days=days), today - datetime.timedelta(days=1)):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='путь к файлу SQLite (будет создан)')
+    parser.add_argument('--staff', type=int, default=5000)
+    parser.add_argument('--departments', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(args.db)}'})
+    with app.app_context():
+        db.create_all()
+        generate(staff=args.staff, departments=args.departments, days=args.days, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
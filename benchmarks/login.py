@@ -0,0 +1,83 @@
+"""
+Стоимость входа и проверки токена.
+
+Для каждого метода хэширования паролей меряет вход (POST /api/v1/login) последовательно
+и в несколько потоков, затем - запросы с токеном: из кэша токенов и с походом в базу на каждый запрос.
+
+    python -m benchmarks.login --logins 50 --threads 4
+    python -m benchmarks.login --method scrypt:32768:8:1 --method pbkdf2:sha256:600000
+"""
+import os
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from StaffGrapf import db, create_app
+from StaffGrapf.auth import auth
+from StaffGrapf.models import Staff
+
+
+METHODS = ('scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000', 'pbkdf2:sha256:100000')
+PASSWORD = 'correct horse battery staple'
+
+
+def make_app(path, method, **config):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'PASSWORD_HASH_METHOD': method,
+                      'AUTO_CLOSE_INTERVAL': 0, **config})
+    with app.app_context():
+        db.create_all()
+        if not db.session.query(Staff.id).first():
+            Staff.create_staff(firstname='Bench', lastname='Admin', gender=True, phone='+70000000000',
+                               password=PASSWORD, active=True, admin=True, at_work='09:00', from_work='18:00')
+    return app
+
+
+def login(app):
+    response = app.test_client().post('/api/v1/login', json={'phone': '+70000000000', 'password': PASSWORD})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.json['token']
+
+
+def timed(function, count, threads=1):
+    started = time.perf_counter()
+    if threads == 1:
+        for _ in range(count):
+            function()
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: function(), range(count)))
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', action='append', help='метод werkzeug (можно несколько), по умолчанию набор METHODS')
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000, help='запросов с токеном')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'{"method":<24} {"hash ms":>8} {"logins/s":>9} {"x" + str(args.threads) + " threads":>12}')
+        for method in args.method or METHODS:
+            app = make_app(os.path.join(directory, 'login.db'), method)
+            with app.app_context():
+                started = time.perf_counter()
+                auth.hash_password(PASSWORD)
+                hash_ms = (time.perf_counter() - started) * 1000
+            sequential = timed(lambda: login(app), args.logins)
+            parallel = timed(lambda: login(app), args.logins, args.threads)
+            print(f'{method:<24} {hash_ms:8.1f} {sequential:9.1f} {parallel:12.1f}')
+
+        print()
+        for title, ttl in (('token cache', 60), ('no token cache', 0)):
+            app = make_app(os.path.join(directory, 'login.db'), METHODS[-1], TOKEN_CACHE_TTL=ttl)
+            headers = {'Authorization': f'Bearer {login(app)}'}
+            client = app.test_client()
+            rate = timed(lambda: client.get('/api/v1/getStaff', json={'staff_id': 1}, headers=headers),
+                         args.requests)
+            print(f'getStaff, {title:<16} {rate:9.0f} requests/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+Нагрузочные сценарии для /api/v1.
+
+Создает (или берет готовую) базу с синтетическими данными, прогоняет сценарии
+через тестовый клиент Flask (или локальный сервер, --url) и печатает/сохраняет
+p50/p95/p99, пропускную способность и число SQL-запросов на запрос по каждому эндпоинту.
+
+    python -m benchmarks.run --db /tmp/bench.db --staff 5000 --days 365 --output results.json
+    python -m benchmarks.run --compare old.json new.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import threading
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from StaffGrapf import db, create_app
+from StaffGrapf.models import Staff
+from .datagen import generate, LASTNAMES
+
+
+class QueryCounter:
+    """
+    Считает SQL-запросы, выполненные в текущем потоке
+    """
+
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+class TestClientTarget:
+    def __init__(self, app, counter):
+        self.app = app
+        self.counter = counter
+        self._local = threading.local()
+
+    def request(self, path, payload=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        self.counter.reset()
+        response = client.get(path, json=payload, headers=headers)
+        response.get_data()
+        return response.status_code, self.counter.count
+
+
+class ServerTarget:
+    def __init__(self, url, token=None):
+        self.url = url.rstrip('/')
+        self.headers = {'Content-Type': 'application/json'}
+        if token:
+            self.headers['Authorization'] = f'Bearer {token}'
+
+    def request(self, path, payload=None, headers=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method='GET',
+                                         headers={**self.headers, **(headers or {})})
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status, None
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def call(self, target, name, path, payload=None, headers=None):
+        started = time.perf_counter()
+        status, queries = target.request(path, payload, headers)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(name, []).append((elapsed, queries, status))
+
+    def summary(self, durations):
+        results = {}
+        for name, samples in self.samples.items():
+            latencies = sorted(sample[0] * 1000 for sample in samples)
+            queries = [sample[1] for sample in samples if sample[1] is not None]
+            cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 \
+                else latencies * 99
+            results[name] = {
+                'requests': len(samples),
+                'errors': sum(1 for sample in samples if sample[2] >= 500),
+                'p50_ms': round(cuts[49], 3),
+                'p95_ms': round(cuts[94], 3),
+                'p99_ms': round(cuts[98], 3),
+                'max_ms': round(latencies[-1], 3),
+                'throughput_rps': round(len(samples) / durations[name], 1) if durations.get(name) else None,
+                'queries_per_request': round(statistics.mean(queries), 2) if queries else None
+            }
+        return results
+
+
+def run_parallel(recorder, target, name, jobs, concurrency, durations):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(recorder.call, target, name, *job) for job in jobs]:
+            future.result()
+    durations[name] = durations.get(name, 0) + time.perf_counter() - started
+
+
+def run_scenarios(target, staff_count, departments, args):
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    durations = {}
+    burst = rng.sample(range(1, staff_count + 1), min(args.burst, staff_count))
+
+    # пересменка: волна check-in, параллельно админы опрашивают todayMarkers
+    polling = threading.Thread(target=run_parallel, args=(
+        recorder, target, 'todayMarkers (during burst)',
+        [('/api/v1/todayMarkers', None)] * args.polls, args.pollers, durations))
+    polling.start()
+    check_ins = [('/api/v1/markerIn', {'staff': staff_id, 'reason': ''}, {'Idempotency-Key': f'burst-{staff_id}'})
+                 for staff_id in burst]
+    run_parallel(recorder, target, 'markerIn', check_ins, args.concurrency, durations)
+    polling.join()
+
+    # клиенты, не дождавшиеся ответа, повторяют check-in с тем же Idempotency-Key
+    run_parallel(recorder, target, 'markerIn (retry)', check_ins, args.concurrency, durations)
+
+    run_parallel(recorder, target, 'todayMarkers',
+                 [('/api/v1/todayMarkers', None)] * args.polls, args.pollers, durations)
+
+    run_parallel(recorder, target, 'searchStaff',
+                 [('/api/v1/searchStaff', {'q': rng.choice(LASTNAMES)[:rng.randint(2, 5)]})
+                  for _ in range(args.requests)], args.concurrency, durations)
+
+    run_parallel(recorder, target, 'getStaffsFromDepartment',
+                 [('/api/v1/getStaffsFromDepartment', {'department_id': rng.randint(1, departments)})
+                  for _ in range(args.requests)], args.concurrency, durations)
+
+    run_parallel(recorder, target, 'markerBatch',
+                 [('/api/v1/markerBatch', {'events': [{'staff': staff_id, 'reason': '', 'action': 'out'}
+                                                       for staff_id in burst[start:start + 100]]})
+                  for start in range(0, len(burst) // 2, 100)], args.concurrency, durations)
+
+    run_parallel(recorder, target, 'markerOut',
+                 [('/api/v1/markerOut', {'staff': staff_id, 'reason': ''}) for staff_id in burst[len(burst) // 2:]],
+                 args.concurrency, durations)
+
+    return recorder.summary(durations)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f'{"endpoint":32} {"req":>6} {"err":>4} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"rps":>8} {"q/req":>6}')
+    for name, row in results.items():
+        print(f'{name:32} {row["requests"]:6} {row["errors"]:4} {row["p50_ms"]:9.2f} {row["p95_ms"]:9.2f} '
+              f'{row["p99_ms"]:9.2f} {row["throughput_rps"] or 0:8.1f} {row["queries_per_request"] or "-":>6}')
+
+
+def compare(old_path, new_path):
+    with open(old_path) as file:
+        old = json.load(file)['results']
+    with open(new_path) as file:
+        new = json.load(file)['results']
+
+    print(f'{"endpoint":32} {"p95 old":>9} {"p95 new":>9} {"change":>8}')
+    for name in new:
+        if name not in old:
+            continue
+        change = (new[name]['p95_ms'] - old[name]['p95_ms']) / old[name]['p95_ms'] * 100 if old[name]['p95_ms'] else 0
+        print(f'{name:32} {old[name]["p95_ms"]:9.2f} {new[name]["p95_ms"]:9.2f} {change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='bench.db', help='файл SQLite; создается и заполняется, если его нет')
+    parser.add_argument('--url', help='гонять сценарии против запущенного сервера вместо тестового клиента')
+    parser.add_argument('--token', help='токен администратора для --url (POST /api/v1/login)')
+    parser.add_argument('--staff', type=int, default=5000)
+    parser.add_argument('--departments', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--burst', type=int, default=1000, help='сколько человек приходит в пересменку')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--pollers', type=int, default=4)
+    parser.add_argument('--polls', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=300, help='запросов на сценарий чтения')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='сравнить два сохраненных прогона')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    path = os.path.abspath(args.db)
+    fresh = not os.path.exists(path)
+    # тестовый клиент ходит без входа: сценарии меряют эндпоинты, а не проверку токена
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'AUTH_ENABLED': False})
+    with app.app_context():
+        if fresh:
+            print(f'generating {args.staff} staff x {args.days} days into {path}', file=sys.stderr)
+            db.create_all()
+            generate(staff=args.staff, departments=args.departments, days=args.days, seed=args.seed)
+        staff_count = db.session.query(Staff).count()
+        counter = QueryCounter(db.engine)
+
+    target = ServerTarget(args.url, args.token) if args.url else TestClientTarget(app, counter)
+    results = run_scenarios(target, staff_count, args.departments, args)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'target': args.url or 'test client',
+                    'staff': staff_count,
+                    'days': args.days,
+                    'burst': args.burst,
+                    'concurrency': args.concurrency
+                },
+                'results': results
+            }, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
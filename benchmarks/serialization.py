@@ -0,0 +1,144 @@
+"""
+CPU на запрос у списочных эндпоинтов: сериализация через схемы (schemas.py) и orjson
+против прежнего пути (объекты ORM -> словари вручную -> стандартный json),
+а также CPU и память на строку при чтении объектов ORM, столбцов через ORM и проекций (projections.py).
+
+    python -m benchmarks.serialization --db bench.db --staff 20000 --departments 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from StaffGrapf import db, create_app, projections
+from StaffGrapf.models import Staff
+from StaffGrapf.photos import thumbnail_url
+from StaffGrapf.additional_functions import json_page
+from .datagen import generate, LASTNAMES
+
+
+def legacy_department_page(department_id, limit):
+    """
+    Страница отдела так, как она строилась до схем: полные объекты Staff и словарь вручную
+    """
+    staffs = Staff.query.filter(Staff.department_id == department_id).order_by(Staff.id).limit(limit + 1).all()
+    rows = [{
+        'id': staff.id,
+        'photo': staff.photo,
+        'thumbnail': thumbnail_url(staff.photo),
+        'appointment': staff.appointment,
+        'firstname': staff.firstname,
+        'lastname': staff.lastname,
+        'middle_name': staff.middle_name,
+        'gender': staff.gender,
+        'phone': staff.phone,
+        'email': staff.email,
+        'active': staff.active,
+        'department_id': staff.department_id
+    } for staff in staffs]
+    return json.dumps({'status': rows[:limit], 'next_cursor': rows[limit - 1]['id'] if len(rows) > limit else None})
+
+
+def department_page(department_id, limit):
+    return ''.join(json_page('status', Staff.get_staffs_from_department(department_id=department_id, limit=limit),
+                             limit))
+
+
+def cpu_per_call(function, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        function()
+    return (time.process_time() - started) / repeat * 1000
+
+
+def row_cost(load, repeat):
+    """
+    CPU (мс) и пиковая память (байт) на загрузку всех строк load()
+    """
+    cpu = cpu_per_call(load, repeat)
+    tracemalloc.start()
+    rows = load()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak, len(rows)
+
+
+def endpoint_cpu(app, requests, repeat):
+    client = app.test_client()
+    results = {}
+    for name, path, payload in requests:
+        def call():
+            response = client.get(path, json=payload)
+            response.get_data()
+            assert response.status_code == 200, response.status_code
+        call()
+        results[name] = cpu_per_call(call, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='bench.db', help='файл SQLite; создается и заполняется, если его нет')
+    parser.add_argument('--staff', type=int, default=20000)
+    parser.add_argument('--departments', type=int, default=20)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--limit', type=int, default=1000, help='размер страницы отдела')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.db)
+    fresh = not os.path.exists(path)
+    # кэш ответов выключен: меряется построение ответа, а не отдача из кэша
+    config = {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'RESPONSE_CACHE_SIZE': 0, 'MAX_PAGE_SIZE': args.limit,
+              'AUTH_ENABLED': False}
+    apps = {'schemas + orjson': create_app({**config, 'JSON_ORJSON': True}),
+            'schemas + json': create_app({**config, 'JSON_ORJSON': False})}
+
+    with apps['schemas + json'].app_context():
+        if fresh:
+            print(f'generating {args.staff} staff x {args.days} days into {path}', file=sys.stderr)
+            db.create_all()
+            generate(staff=args.staff, departments=args.departments, days=args.days, seed=args.seed)
+        department_id = db.session.query(Staff.department_id).filter(Staff.department_id != None).first()[0]
+        staff = projections.STAFF
+        loaders = {
+            'orm objects': lambda: Staff.query.all(),
+            'orm columns': lambda: db.session.query(*[getattr(Staff, field) for field in staff.fields]).all(),
+            'projection': lambda: staff.rows(staff.select()).all(),
+        }
+        rows = {name: row_cost(load, max(args.repeat // 10, 1)) for name, load in loaders.items()}
+        pages = {'orm + dict + json': cpu_per_call(lambda: legacy_department_page(department_id, args.limit),
+                                                   args.repeat)}
+        db.session.remove()
+
+    for variant, variant_app in apps.items():
+        with variant_app.app_context():
+            pages[variant] = cpu_per_call(lambda: department_page(department_id, args.limit), args.repeat)
+            db.session.remove()
+
+    rng = random.Random(args.seed)
+    requests = [
+        ('getStaffsFromDepartment', '/api/v1/getStaffsFromDepartment',
+         {'department_id': department_id, 'limit': args.limit}),
+        ('searchStaff', '/api/v1/searchStaff', {'q': rng.choice(LASTNAMES)[:3], 'per_page': 100}),
+    ]
+
+    print('чтение всех строк staff')
+    for name, (cpu, peak, count) in rows.items():
+        print(f'{name:24} {cpu / count * 1000:7.2f} us/row, {peak / count:7.0f} bytes/row')
+
+    print(f'\nстраница отдела из {args.limit} строк без HTTP')
+    for variant, cpu in pages.items():
+        print(f'{variant:24} {cpu:9.3f} ms, {cpu / args.limit * 1000:7.2f} us/row')
+
+    print(f'\n{"variant":24} {"endpoint":28} {"cpu ms/request":>15}')
+    for variant, variant_app in apps.items():
+        for name, cpu in endpoint_cpu(variant_app, requests, args.repeat).items():
+            print(f'{variant:24} {name:28} {cpu:15.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Организации со своими базами.
+
+1. Время create_app в зависимости от числа организаций (движки создаются при первом запросе,
+   поэтому время должно оставаться постоянным).
+2. Задержка отметок организации B, пока организация A отмечает всплеск прихода/ухода
+   в несколько потоков: базы организаций (TENANT_DATABASE_URL) против одной общей базы.
+
+    python -m benchmarks.tenants --staff 500 --burst-threads 8 --probes 200
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+from StaffGrapf import db, create_app
+from StaffGrapf.tenants import tenants
+from .datagen import generate
+
+
+TENANT_COUNTS = (0, 10, 100, 1000)
+CONFIG = {'AUTH_ENABLED': False, 'AUTO_CLOSE_INTERVAL': 0}
+
+
+def startup(directory, count, repeat=5):
+    """
+    Медиана create_app (мс) при count файлах организаций
+    """
+    os.makedirs(directory, exist_ok=True)
+    for number in range(count):
+        open(os.path.join(directory, f'tenant{number}.db'), 'a').close()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        create_app({**CONFIG, 'TENANT_DATABASE_URL': f'sqlite:///{directory}/{{tenant}}.db'})
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def burst(app, headers, staff_ids, stop):
+    """
+    Приход и уход сотрудников staff_ids по кругу, пока не выставлен stop
+    """
+    client = app.test_client()
+    while not stop.is_set():
+        for path in ('/api/v1/markerIn', '/api/v1/markerOut'):
+            for staff_id in staff_ids:
+                if stop.is_set():
+                    return
+                client.get(path, json={'staff': staff_id}, headers=headers)
+
+
+def probe(app, headers, staff_ids, count):
+    """
+    Задержки (мс) отметок сотрудников staff_ids по одному запросу подряд
+    """
+    client = app.test_client()
+    timings = []
+    for number in range(count):
+        staff_id = staff_ids[number // 2 % len(staff_ids)]
+        started = time.perf_counter()
+        response = client.get('/api/v1/markerOut' if number % 2 else '/api/v1/markerIn',
+                              json={'staff': staff_id}, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return timings
+
+
+def isolation(app, a_headers, a_staff, b_headers, b_staff, args):
+    quiet = probe(app, b_headers, b_staff, args.probes)
+
+    stop = threading.Event()
+    chunk = max(len(a_staff) // args.burst_threads, 1)
+    threads = [threading.Thread(target=burst, args=(app, a_headers, a_staff[start:start + chunk], stop))
+               for start in range(0, len(a_staff), chunk)]
+    for thread in threads:
+        thread.start()
+    try:
+        loaded = probe(app, b_headers, b_staff, args.probes)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return quiet, loaded
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--staff', type=int, default=500, help='сотрудников в организации')
+    parser.add_argument('--burst-threads', type=int, default=8)
+    parser.add_argument('--probes', type=int, default=200, help='отметок организации B на замер')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print('create_app')
+        for count in TENANT_COUNTS:
+            print(f'  {count:>5} tenants {startup(os.path.join(directory, "startup"), count):8.1f} ms')
+
+        # одна база: сотрудники A - первая половина, B - вторая
+        app = create_app({**CONFIG, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/shared.db'})
+        with app.app_context():
+            db.create_all()
+            generate(staff=args.staff * 2, departments=10, days=0)
+        shared = isolation(app, {}, list(range(1, args.staff + 1)),
+                           {}, list(range(args.staff + 1, args.staff + 11)), args)
+
+        app = create_app({**CONFIG, 'TENANT_DATABASE_URL': f'sqlite:///{directory}/tenants/{{tenant}}.db'})
+        with app.app_context():
+            for name in ('a', 'b'):
+                tenants.create(name)
+                db.metadata.create_all(tenants.engine(name))
+                with tenants.use(name):
+                    generate(staff=args.staff, departments=10, days=0)
+        separate = isolation(app, {'X-Tenant': 'a'}, list(range(1, args.staff + 1)),
+                             {'X-Tenant': 'b'}, list(range(1, 11)), args)
+
+    print(f'\ntenant B markerIn/markerOut latency, ms ({args.burst_threads} threads of tenant A writing)')
+    print(f'{"":<18} {"p50 quiet":>10} {"p50 burst":>10} {"p99 quiet":>10} {"p99 burst":>10}')
+    for title, (quiet, loaded) in (('shared database', shared), ('tenant databases', separate)):
+        print(f'{title:<18} {percentile(quiet, 0.5):10.2f} {percentile(loaded, 0.5):10.2f} '
+              f'{percentile(quiet, 0.99):10.2f} {percentile(loaded, 0.99):10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Пропускная способность отметки по Wi-Fi: разбор строк hostapd/RADIUS, подавление дребезга
+и пакетная запись маркеров на одном ядре.
+
+    python -m benchmarks.wifi --db wifi.db --staff 2000 --events 200000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from StaffGrapf import db, create_app
+from StaffGrapf.models import Device, Staff
+from StaffGrapf.wifi import WifiIngestor, parse_line
+from .datagen import generate
+
+
+HOSTAPD = '{time} ap1 hostapd: wlan0: AP-STA-{event} {mac}'
+HOSTAPD_80211 = '{time} ap2 hostapd: wlan0: STA {mac} IEEE 802.11: {event}'
+RADIUS = '{time} radius: Acct-Status-Type = {event}, Calling-Station-Id = "{mac}", NAS-IP-Address = 10.0.0.1'
+FORMATS = ((HOSTAPD, 'CONNECTED', 'DISCONNECTED'), (HOSTAPD_80211, 'associated', 'disassociated'),
+           (RADIUS, 'Start', 'Stop'))
+
+
+def device_mac(number):
+    return ':'.join(f'{byte:02x}' for byte in (0x02, 0, *(number.to_bytes(4, 'big'))))
+
+
+def make_lines(staff_ids, count, rng):
+    """
+    Синтетический поток: устройства подключаются, часть отключается и тут же возвращается (дребезг),
+    часть уходит насовсем; каждая строка - в одном из трех форматов
+    """
+    lines = []
+    connected = set()
+    while len(lines) < count:
+        staff_id = rng.choice(staff_ids)
+        mac = device_mac(staff_id)
+        template, connect, disconnect = rng.choice(FORMATS)
+        event = disconnect if staff_id in connected else connect
+        lines.append(template.format(time='Oct 18 09:00:00', event=event, mac=mac))
+        if event == connect:
+            connected.add(staff_id)
+        else:
+            connected.discard(staff_id)
+        lines.append(f'Oct 18 09:00:00 ap1 kernel: unrelated line {len(lines)}')
+    return lines[:count]
+
+
+class SimulatedClock:
+    """
+    Часы потока событий: каждое обращение сдвигает время на step секунд
+    """
+
+    def __init__(self, step):
+        self.step = step
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='wifi.db', help='файл SQLite; создается и заполняется, если его нет')
+    parser.add_argument('--staff', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--rate', type=float, default=1000, help='событий в секунду в моделируемом потоке')
+    parser.add_argument('--debounce', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.db)
+    fresh = not os.path.exists(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'AUTO_CLOSE_INTERVAL': 0})
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        if fresh:
+            print(f'generating {args.staff} staff with devices into {path}', file=sys.stderr)
+            db.create_all()
+            generate(staff=args.staff, departments=10, days=0, seed=args.seed)
+            db.session.bulk_insert_mappings(Device, [{'mac': device_mac(staff_id), 'staff_id': staff_id}
+                                                     for staff_id, in db.session.query(Staff.id)])
+            db.session.commit()
+        staff_ids = [staff_id for staff_id, in db.session.query(Staff.id)]
+        lines = make_lines(staff_ids, args.events, rng)
+
+        started = time.process_time()
+        parsed = sum(1 for line in lines if parse_line(line))
+        parse_cpu = time.process_time() - started
+
+        ingestor = WifiIngestor(debounce=args.debounce, clock=SimulatedClock(1 / args.rate))
+        started_wall, started = time.perf_counter(), time.process_time()
+        stats = ingestor.run(iter(lines))
+        cpu, wall = time.process_time() - started, time.perf_counter() - started_wall
+
+    print(f'lines {len(lines)}, connection events {parsed}')
+    print(f'parse only        {len(lines) / parse_cpu:12.0f} lines/s cpu')
+    print(f'ingest + writes   {len(lines) / cpu:12.0f} lines/s cpu, {len(lines) / wall:12.0f} lines/s wall')
+    for name, count in sorted(stats.items()):
+        print(f'  {name}: {count}')
+
+
+if __name__ == '__main__':
+    main()
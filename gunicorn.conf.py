@@ -0,0 +1,19 @@
+import os
+import multiprocessing
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+bind = os.environ.get('BIND', '0.0.0.0:5005')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# потоки нужны для долгих соединений markerStream/markerEvents: ждать событий могут не больше
+# EVENTS_MAX_LISTENERS потоков воркера, остальные остаются для отметок
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = 5
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    # фоновые задачи (закрытие забытых маркеров, очистка) работают только в воркерах, не в командах flask
+    from StaffGrapf.scheduler import scheduler
+    scheduler.start()
@@ -0,0 +1,74 @@
+"""marker indexes and staff search index
+
+Revision ID: 3b9d2c41a7e5
+Revises: f63def630f50
+Create Date: 2026-10-18 09:30:00.000000
+
+Индексы только добавляются, таблица marker не перестраивается.
+На PostgreSQL индексы строятся CONCURRENTLY, без блокировки записи.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d2c41a7e5'
+down_revision = 'f63def630f50'
+branch_labels = None
+depends_on = None
+
+# полнотекстовый индекс staff на момент этой ревизии (копия models.STAFF_SEARCH_DDL)
+STAFF_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS staff_search USING fts5(
+        firstname, lastname, middle_name, phone,
+        content='staff', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_ai AFTER INSERT ON staff BEGIN
+        INSERT INTO staff_search(rowid, firstname, lastname, middle_name, phone)
+        VALUES (new.id, new.firstname, new.lastname, new.middle_name, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_ad AFTER DELETE ON staff BEGIN
+        INSERT INTO staff_search(staff_search, rowid, firstname, lastname, middle_name, phone)
+        VALUES ('delete', old.id, old.firstname, old.lastname, old.middle_name, old.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_au AFTER UPDATE OF firstname, lastname, middle_name, phone ON staff
+    BEGIN
+        INSERT INTO staff_search(staff_search, rowid, firstname, lastname, middle_name, phone)
+        VALUES ('delete', old.id, old.firstname, old.lastname, old.middle_name, old.phone);
+        INSERT INTO staff_search(rowid, firstname, lastname, middle_name, phone)
+        VALUES (new.id, new.firstname, new.lastname, new.middle_name, new.phone);
+    END""",
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            _create_marker_indexes(postgresql_concurrently=True)
+    else:
+        _create_marker_indexes()
+
+    if bind.dialect.name == 'sqlite':
+        for statement in STAFF_SEARCH_DDL:
+            op.execute(statement)
+        op.execute("INSERT INTO staff_search(staff_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('staff_search_ai', 'staff_search_ad', 'staff_search_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS staff_search')
+
+    op.drop_index('ix_marker_open', table_name='marker')
+    op.drop_index('ix_marker_time_in', table_name='marker')
+    op.drop_index('ix_marker_staff_id_time_out', table_name='marker')
+
+
+def _create_marker_indexes(**kw):
+    op.create_index('ix_marker_staff_id_time_out', 'marker', ['staff_id', 'time_out'], **kw)
+    op.create_index('ix_marker_time_in', 'marker', ['time_in'], **kw)
+    op.create_index('ix_marker_open', 'marker', ['staff_id'],
+                    sqlite_where=sa.text('time_out IS NULL'),
+                    postgresql_where=sa.text('time_out IS NULL'), **kw)
@@ -0,0 +1,30 @@
+"""marker archive registry
+
+Revision ID: 5a1c9e6b2f04
+Revises: 8e4f17c2d9a3
+Create Date: 2026-10-18 12:00:00.000000
+
+Помесячные таблицы marker_archive_YYYYMM создаются командой flask archive-markers
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a1c9e6b2f04'
+down_revision = '8e4f17c2d9a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('marker_archive',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('month')
+    )
+
+
+def downgrade():
+    op.drop_table('marker_archive')
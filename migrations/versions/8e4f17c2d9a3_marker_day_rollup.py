@@ -0,0 +1,37 @@
+"""marker_day rollup
+
+Revision ID: 8e4f17c2d9a3
+Revises: 3b9d2c41a7e5
+Create Date: 2026-10-18 10:00:00.000000
+
+Таблица заполняется отдельно: flask rebuild-rollup
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f17c2d9a3'
+down_revision = '3b9d2c41a7e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('marker_day',
+    sa.Column('staff_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('first_in', sa.DateTime(), nullable=True),
+    sa.Column('last_out', sa.DateTime(), nullable=True),
+    sa.Column('minutes', sa.Integer(), nullable=False),
+    sa.Column('open_count', sa.Integer(), nullable=False),
+    sa.Column('late', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['staff_id'], ['staff.id'], ),
+    sa.PrimaryKeyConstraint('staff_id', 'day')
+    )
+    op.create_index('ix_marker_day_day', 'marker_day', ['day'])
+
+
+def downgrade():
+    op.drop_index('ix_marker_day_day', table_name='marker_day')
+    op.drop_table('marker_day')
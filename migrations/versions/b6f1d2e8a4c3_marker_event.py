@@ -0,0 +1,37 @@
+"""marker event log
+
+Revision ID: b6f1d2e8a4c3
+Revises: e8a2f6c41d97
+Create Date: 2026-10-18 20:00:00.000000
+
+Журнал изменений маркеров для ленты событий и кэша присутствия всех воркеров
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f1d2e8a4c3'
+down_revision = 'e8a2f6c41d97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('marker_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event', sa.String(length=4), nullable=False),
+    sa.Column('marker_id', sa.Integer(), nullable=False),
+    sa.Column('staff_id', sa.Integer(), nullable=False),
+    sa.Column('time_in', sa.DateTime(), nullable=True),
+    sa.Column('time_out', sa.DateTime(), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index(op.f('ix_marker_event_created'), 'marker_event', ['created'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_marker_event_created'), table_name='marker_event')
+    op.drop_table('marker_event')
@@ -0,0 +1,41 @@
+"""staff trigram search indexes
+
+Revision ID: c2e7a9f4b1d8
+Revises: b6f1d2e8a4c3
+Create Date: 2026-10-18 22:00:00.000000
+
+Только PostgreSQL: поиск персонала по префиксам (ILIKE) по триграммным GIN-индексам pg_trgm
+вместо полного просмотра staff. Индексы строятся CONCURRENTLY, без блокировки записи.
+DDL скопирован сюда, чтобы миграция не зависела от будущих версий models.py
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e7a9f4b1d8'
+down_revision = 'b6f1d2e8a4c3'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('firstname', 'lastname', 'middle_name', 'phone')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for name in COLUMNS:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_staff_{name}_trgm '
+                       f'ON staff USING gin ({name} gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    # расширение pg_trgm не удаляется: им могут пользоваться другие схемы базы
+    with op.get_context().autocommit_block():
+        for name in COLUMNS:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS ix_staff_{name}_trgm')
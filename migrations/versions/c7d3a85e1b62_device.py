@@ -0,0 +1,35 @@
+"""device
+
+Revision ID: c7d3a85e1b62
+Revises: 5a1c9e6b2f04
+Create Date: 2026-10-18 14:00:00.000000
+
+Устройства сотрудников (MAC-адреса) для отметки по Wi-Fi
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d3a85e1b62'
+down_revision = '5a1c9e6b2f04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('device',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('mac', sa.String(length=17), nullable=False),
+    sa.Column('title', sa.String(length=50), nullable=True),
+    sa.Column('staff_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['staff_id'], ['staff.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('mac')
+    )
+    op.create_index(op.f('ix_device_staff_id'), 'device', ['staff_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_device_staff_id'), table_name='device')
+    op.drop_table('device')
@@ -0,0 +1,75 @@
+"""session token
+
+Revision ID: d41b7e9a0c35
+Revises: c7d3a85e1b62
+Create Date: 2026-10-18 16:00:00.000000
+
+Сессии API и место под хэши паролей в staff.password
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b7e9a0c35'
+down_revision = 'c7d3a85e1b62'
+branch_labels = None
+depends_on = None
+
+# полнотекстовый индекс staff на момент этой ревизии (копия models.STAFF_SEARCH_DDL)
+STAFF_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS staff_search USING fts5(
+        firstname, lastname, middle_name, phone,
+        content='staff', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_ai AFTER INSERT ON staff BEGIN
+        INSERT INTO staff_search(rowid, firstname, lastname, middle_name, phone)
+        VALUES (new.id, new.firstname, new.lastname, new.middle_name, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_ad AFTER DELETE ON staff BEGIN
+        INSERT INTO staff_search(staff_search, rowid, firstname, lastname, middle_name, phone)
+        VALUES ('delete', old.id, old.firstname, old.lastname, old.middle_name, old.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS staff_search_au AFTER UPDATE OF firstname, lastname, middle_name, phone ON staff
+    BEGIN
+        INSERT INTO staff_search(staff_search, rowid, firstname, lastname, middle_name, phone)
+        VALUES ('delete', old.id, old.firstname, old.lastname, old.middle_name, old.phone);
+        INSERT INTO staff_search(rowid, firstname, lastname, middle_name, phone)
+        VALUES (new.id, new.firstname, new.lastname, new.middle_name, new.phone);
+    END""",
+)
+
+
+def upgrade():
+    op.create_table('session_token',
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('staff_id', sa.Integer(), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('expires', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['staff_id'], ['staff.id'], ),
+    sa.PrimaryKeyConstraint('token_hash')
+    )
+    op.create_index(op.f('ix_session_token_expires'), 'session_token', ['expires'], unique=False)
+    op.create_index(op.f('ix_session_token_staff_id'), 'session_token', ['staff_id'], unique=False)
+
+    _alter_password(sa.String(length=16), sa.String(length=255))
+
+
+def downgrade():
+    _alter_password(sa.String(length=255), sa.String(length=16))
+
+    op.drop_index(op.f('ix_session_token_staff_id'), table_name='session_token')
+    op.drop_index(op.f('ix_session_token_expires'), table_name='session_token')
+    op.drop_table('session_token')
+
+
+def _alter_password(existing_type, type_):
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('staff', 'password', existing_type=existing_type, type_=type_, existing_nullable=False)
+        return
+
+    # SQLite пересоздает таблицу staff, вместе с ней пропадают триггеры полнотекстового поиска
+    with op.batch_alter_table('staff') as batch_op:
+        batch_op.alter_column('password', existing_type=existing_type, type_=type_, existing_nullable=False)
+    for statement in STAFF_SEARCH_DDL:
+        op.execute(statement)
@@ -0,0 +1,65 @@
+"""idempotency key and unique open marker
+
+Revision ID: e8a2f6c41d97
+Revises: d41b7e9a0c35
+Create Date: 2026-10-18 18:00:00.000000
+
+Ключи идемпотентности markerIn/markerOut и не больше одного открытого маркера на сотрудника.
+Лишние открытые маркеры (кроме последнего) закрываются нулевой длительностью с reason_out 'duplicate';
+сводку за их дни пересобирает flask rebuild-rollup
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a2f6c41d97'
+down_revision = 'd41b7e9a0c35'
+branch_labels = None
+depends_on = None
+
+
+CLOSE_DUPLICATES = """
+UPDATE marker SET time_out = time_in, reason_out = 'duplicate'
+WHERE time_out IS NULL
+  AND id < (SELECT max(latest.id) FROM marker AS latest
+            WHERE latest.staff_id = marker.staff_id AND latest.time_out IS NULL)
+"""
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+    sa.Column('staff_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('action', sa.String(length=3), nullable=False),
+    sa.Column('marker_id', sa.Integer(), nullable=True),
+    sa.Column('expires', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['staff_id'], ['staff.id'], ),
+    sa.PrimaryKeyConstraint('staff_id', 'key')
+    )
+    op.create_index(op.f('ix_idempotency_key_expires'), 'idempotency_key', ['expires'], unique=False)
+
+    op.execute(CLOSE_DUPLICATES)
+    op.drop_index('ix_marker_open', table_name='marker')
+    _create_open_index(unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_marker_open', table_name='marker')
+    _create_open_index(unique=False)
+
+    op.drop_index(op.f('ix_idempotency_key_expires'), table_name='idempotency_key')
+    op.drop_table('idempotency_key')
+
+
+def _create_open_index(unique):
+    def create(**kw):
+        op.create_index('ix_marker_open', 'marker', ['staff_id'], unique=unique,
+                        sqlite_where=sa.text('time_out IS NULL'),
+                        postgresql_where=sa.text('time_out IS NULL'), **kw)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            create(postgresql_concurrently=True)
+    else:
+        create()
@@ -1,5 +1,12 @@
+import os
 from StaffGrapf import db, create_app
+from StaffGrapf.scheduler import scheduler
 
-db.create_all(app=create_app())
+# Сервер разработки. В продакшене: gunicorn -c gunicorn.conf.py wsgi:app
 app = create_app()
-app.run(host='0.0.0.0', port='5005', debug=True)
+with app.app_context():
+    db.create_all()
+# с перезагрузчиком (FLASK_DEBUG=1) запросы обслуживает дочерний процесс
+if os.environ.get('FLASK_DEBUG') != '1' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    scheduler.start()
+app.run(host='0.0.0.0', port=os.environ.get('PORT', '5005'), debug=os.environ.get('FLASK_DEBUG') == '1')
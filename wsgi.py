@@ -0,0 +1,3 @@
+from StaffGrapf import create_app
+
+app = create_app()